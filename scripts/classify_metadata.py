@@ -4,16 +4,121 @@
 自动分类HLA类型、样本类型、疾病类型等
 """
 
+import os
 import sys
+import numpy as np
 import pandas as pd
 import re
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import List, Set, Tuple, Optional
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+try:
+    from joblib import Parallel, delayed
+    JOBLIB_AVAILABLE = True
+except ImportError:
+    JOBLIB_AVAILABLE = False
+
+
+def read_csv_fast(path: Path) -> pd.DataFrame:
+    """读取CSV文件（优先使用pyarrow的多线程C++解析器）"""
+    if PYARROW_AVAILABLE:
+        try:
+            return pacsv.read_csv(str(path)).to_pandas()
+        except Exception:
+            pass
+    return pd.read_csv(path)
+
+
+def as_arrow_strings(df: pd.DataFrame) -> pd.DataFrame:
+    """把文本列转为Arrow后端的string dtype
+
+    Arrow字符串列连续存储，str访问器的扫描比object数组快且省内存；
+    只转换非空值确实是字符串的列：含空值的布尔列（如has_sdrf）
+    读入后也是object dtype，转成字符串会把False变成truthy的'False'；
+    pyarrow不可用时原样返回
+    """
+    if not PYARROW_AVAILABLE:
+        return df
+    try:
+        for col in df.select_dtypes(include=['object', 'string']).columns:
+            if pd.api.types.infer_dtype(df[col], skipna=True) in ('string', 'empty'):
+                df[col] = df[col].astype('string[pyarrow]')
+    except Exception:
+        pass
+    return df
+
+
+def write_parquet(df: pd.DataFrame, path: Path) -> bool:
+    """把DataFrame写为Parquet中间文件（pyarrow不可用时跳过）"""
+    if not PYARROW_AVAILABLE:
+        return False
+    try:
+        df.to_parquet(path, compression='zstd')
+        return True
+    except Exception:
+        return False
+
+
+def read_table(path: Path) -> pd.DataFrame:
+    """按后缀读取Parquet或CSV"""
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path)
+    return read_csv_fast(path)
+
+
+def write_csv_fast(df: pd.DataFrame, path: Path):
+    """写出CSV文件，保持utf-8-sig编码以兼容Excel"""
+    if PYARROW_AVAILABLE:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with open(path, 'wb') as f:
+                f.write(b'\xef\xbb\xbf')  # BOM
+                pacsv.write_csv(table, f)
+            return
+        except Exception:
+            pass
+    # 分块流式写出，显式'\n'行尾避免平台相关的换行转换
+    df.to_csv(path, index=False, encoding='utf-8-sig',
+              chunksize=10_000, lineterminator='\n')
+
+
+def write_records_json(df: pd.DataFrame, json_path: Path):
+    """把DataFrame按records格式写为JSON（优先使用orjson的C级序列化）"""
+    if ORJSON_AVAILABLE:
+        records = df.astype(object).where(df.notna(), None).to_dict(orient='records')
+        json_path.write_bytes(
+            orjson.dumps(records, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        )
+    else:
+        df.to_json(json_path, orient='records', indent=2, force_ascii=False)
 
 # 项目路径配置
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 
+# 短大写缩写词（ALS/HIV/SARS等）：不区分大小写匹配时必须加\b整词边界，
+# 否则会命中普通单词内部的子串（"also"含als、"archived"含hiv）
+_ACRONYM_RE = re.compile(r'^[A-Z]{2,5}$')
+
 
 class MetadataClassifier:
     """元数据分类器"""
@@ -86,6 +191,159 @@ class MetadataClassifier:
             'non-disease', 'wild type', 'wild-type'
         ]
 
+        # 预编译各关键词组的合并正则
+        # 向量化分类时每组只需一次C级扫描，避免逐行逐关键词的Python循环
+        self.hla_i_re = self._build_keyword_regex(self.hla_i_keywords)
+        self.hla_ii_re = self._build_keyword_regex(self.hla_ii_keywords)
+        self.hla_general_re = self._build_keyword_regex(self.hla_general_keywords)
+        self.blood_re = self._build_keyword_regex(self.blood_keywords)
+        self.tissue_re = self._build_keyword_regex(self.tissue_keywords)
+        self.cell_line_re = self._build_keyword_regex(self.cell_line_keywords)
+        self.cancer_re = self._build_keyword_regex(self.cancer_keywords)
+        self.neurodegenerative_re = self._build_keyword_regex(self.neurodegenerative_keywords)
+        self.infectious_re = self._build_keyword_regex(self.infectious_keywords)
+        self.healthy_re = self._build_keyword_regex(self.healthy_keywords)
+        self.no_disease_re = re.compile('not available|not applicable', re.IGNORECASE)
+
+        # 整词关键词的frozenset（统一大写一次，避免每行重复.upper()）
+        # 集合交集作为O(1)快路径，未命中时再退回整组alternation正则
+        self.hla_i_tokens = self._token_set(self.hla_i_keywords)
+        self.hla_ii_tokens = self._token_set(self.hla_ii_keywords)
+        self.hla_general_tokens = self._token_set(self.hla_general_keywords)
+        self.blood_tokens = self._token_set(self.blood_keywords)
+        self.tissue_tokens = self._token_set(self.tissue_keywords)
+        self.cell_line_tokens = self._token_set(self.cell_line_keywords)
+        self.cancer_tokens = self._token_set(self.cancer_keywords)
+        self.neurodegenerative_tokens = self._token_set(self.neurodegenerative_keywords)
+        self.infectious_tokens = self._token_set(self.infectious_keywords)
+        self.healthy_tokens = self._token_set(self.healthy_keywords)
+
+        # 具体细胞系/组织名称的提取正则（预编译，避免每行查询regex缓存）
+        self._cell_line_name_re = re.compile(
+            r'(HeLa|HEK293|Jurkat|K562|MCF-?7|A549|U2OS)',
+            re.IGNORECASE
+        )
+        self._tissue_name_re = re.compile(
+            r'(liver|kidney|lung|brain|heart|breast|ovary|prostate|colon|'
+            r'tumor|tumour|cancer|melanoma)',
+            re.IGNORECASE
+        )
+
+        # Aho-Corasick自动机：把所有关键词组装进一个trie，
+        # 逐行分类时对文本做一次线性扫描即可得到命中的全部类别
+        self.automaton = self._build_automaton({
+            'hla_i': self.hla_i_keywords,
+            'hla_ii': self.hla_ii_keywords,
+            'hla_general': self.hla_general_keywords,
+            'blood': self.blood_keywords,
+            'tissue': self.tissue_keywords,
+            'cell_line': self.cell_line_keywords,
+            'cancer': self.cancer_keywords,
+            'neurodegenerative': self.neurodegenerative_keywords,
+            'infectious': self.infectious_keywords,
+            'healthy': self.healthy_keywords,
+        })
+
+    def _build_automaton(self, keyword_groups: dict):
+        """构建多模式匹配自动机（pyahocorasick不可用时返回None）
+
+        自动机只做子串匹配，无法表达整词边界，所以短缩写词
+        （ALS/HIV/SARS等）不进自动机，改由带\b的正则补扫，
+        避免"also"/"archived"这类普通单词内部的误命中
+        """
+        # 各类别的缩写词边界正则（扫描时在自动机结果上补充）
+        self._acronym_res = {}
+        for category, keywords in keyword_groups.items():
+            acronyms = [k for k in keywords if _ACRONYM_RE.match(k)]
+            if acronyms:
+                self._acronym_res[category] = re.compile(
+                    '|'.join(r'\b' + re.escape(k) + r'\b' for k in acronyms),
+                    re.IGNORECASE
+                )
+
+        if not AHOCORASICK_AVAILABLE:
+            return None
+        automaton = ahocorasick.Automaton()
+        for category, keywords in keyword_groups.items():
+            for keyword in keywords:
+                if _ACRONYM_RE.match(keyword):
+                    continue
+                key = keyword.lower()
+                # 同一个词可能属于多个类别
+                if automaton.exists(key):
+                    automaton.get(key).add(category)
+                else:
+                    automaton.add_word(key, {category})
+        automaton.make_automaton()
+        return automaton
+
+    def _match_categories(self, text_lower: str) -> Set[str]:
+        """单次扫描文本，返回命中的所有关键词类别
+
+        调用方负责传入已小写的文本，避免每个关键词组重复case转换
+        """
+        categories = set()
+        for _, matched in self.automaton.iter(text_lower):
+            categories |= matched
+        # 缩写词不在自动机里，按类别用边界正则补扫
+        for category, pattern in self._acronym_res.items():
+            if category not in categories and pattern.search(text_lower):
+                categories.add(category)
+        return categories
+
+    @staticmethod
+    def _build_keyword_regex(keywords: List[str]) -> re.Pattern:
+        """把关键词列表合并为一个不区分大小写的alternation正则
+
+        短缩写词自动加\b边界，只做整词匹配
+        """
+        parts = []
+        for keyword in keywords:
+            escaped = re.escape(keyword)
+            if _ACRONYM_RE.match(keyword):
+                escaped = r'\b' + escaped + r'\b'
+            parts.append(escaped)
+        return re.compile('|'.join(parts), re.IGNORECASE)
+
+    @staticmethod
+    def _token_set(keywords: List[str]) -> frozenset:
+        """提取单词型关键词（不含空格），统一大写后存为frozenset"""
+        return frozenset(k.upper() for k in keywords if ' ' not in k)
+
+    @staticmethod
+    def _keyword_hit(tokens: frozenset, token_set: frozenset,
+                     pattern: re.Pattern, text: str) -> bool:
+        """先用集合交集测试整词命中，再退回一次整组正则扫描"""
+        if token_set & tokens:
+            return True
+        return bool(pattern.search(text))
+
+    @staticmethod
+    def _dedup_contains_factory(combined: pd.Series):
+        """
+        对拼接文本做一次factorize去重，返回只扫描唯一值的contains函数
+
+        重复数据集（同一研究的多个副本）共享扫描结果，
+        扫描成本按唯一文本数而不是行数摊销
+        """
+        codes, uniques = pd.factorize(combined)
+        uniq = pd.Series(uniques).astype(str)
+
+        def contains(pattern) -> pd.Series:
+            hits = uniq.str.contains(pattern, regex=True, na=False).to_numpy()
+            return pd.Series(hits[codes], index=combined.index)
+
+        return contains
+
+    @staticmethod
+    def _combine_text_columns(df: pd.DataFrame, columns: List[str]) -> pd.Series:
+        """按行拼接文本字段并统一小写（缺失列按空字符串处理）"""
+        combined = pd.Series('', index=df.index)
+        for col in columns:
+            if col in df.columns:
+                combined = combined + ' ' + df[col].fillna('').astype(str)
+        return combined.str.lower()
+
     def classify_hla_type(self, row: pd.Series) -> Tuple[str, bool]:
         """
         分类HLA类型
@@ -104,29 +362,27 @@ class MetadataClassifier:
             str(row.get('project_tags', '')),
             str(row.get('sample_protocol', '')),
         ]
-        combined_text = ' '.join(text_fields).upper()
-
-        # 检查是否是HLA相关研究
-        is_hla_related = any(
-            keyword.upper() in combined_text
-            for keyword in self.hla_general_keywords
-        )
+        # 只做一次case转换，供自动机扫描使用
+        combined_text = ' '.join(text_fields)
+
+        if self.automaton is not None:
+            # 一次线性扫描得到所有命中类别
+            categories = self._match_categories(combined_text.lower())
+            is_hla_related = 'hla_general' in categories
+            has_hla_i = 'hla_i' in categories
+            has_hla_ii = 'hla_ii' in categories
+        else:
+            tokens = frozenset(combined_text.upper().split())
+            is_hla_related = self._keyword_hit(
+                tokens, self.hla_general_tokens, self.hla_general_re, combined_text)
+            has_hla_i = self._keyword_hit(
+                tokens, self.hla_i_tokens, self.hla_i_re, combined_text)
+            has_hla_ii = self._keyword_hit(
+                tokens, self.hla_ii_tokens, self.hla_ii_re, combined_text)
 
         if not is_hla_related:
             return 'Non-HLA', False
 
-        # 检查HLA I类
-        has_hla_i = any(
-            keyword.upper() in combined_text
-            for keyword in self.hla_i_keywords
-        )
-
-        # 检查HLA II类
-        has_hla_ii = any(
-            keyword.upper() in combined_text
-            for keyword in self.hla_ii_keywords
-        )
-
         # 分类逻辑
         if has_hla_i and has_hla_ii:
             return 'HLA I/II', False
@@ -160,20 +416,30 @@ class MetadataClassifier:
         ]
         combined_text = ' '.join(text_fields).lower()
 
+        if self.automaton is not None:
+            categories = self._match_categories(combined_text)
+            is_cell_line = 'cell_line' in categories
+            is_blood = 'blood' in categories
+            is_tissue = 'tissue' in categories
+        else:
+            tokens = frozenset(combined_text.upper().split())
+            is_cell_line = self._keyword_hit(
+                tokens, self.cell_line_tokens, self.cell_line_re, combined_text)
+            is_blood = self._keyword_hit(
+                tokens, self.blood_tokens, self.blood_re, combined_text)
+            is_tissue = self._keyword_hit(
+                tokens, self.tissue_tokens, self.tissue_re, combined_text)
+
         # 优先检查细胞系（最具体）
-        if any(keyword.lower() in combined_text for keyword in self.cell_line_keywords):
+        if is_cell_line:
             # 尝试提取具体的细胞系名称
-            cell_line_match = re.search(
-                r'(HeLa|HEK293|Jurkat|K562|MCF-?7|A549|U2OS)',
-                combined_text,
-                re.IGNORECASE
-            )
+            cell_line_match = self._cell_line_name_re.search(combined_text)
             if cell_line_match:
                 return f'Cell line ({cell_line_match.group(1)})'
             return 'Cell line'
 
         # 检查血液
-        if any(keyword in combined_text for keyword in self.blood_keywords):
+        if is_blood:
             # 尝试提取具体类型
             if 'pbmc' in combined_text:
                 return 'Blood (PBMC)'
@@ -184,14 +450,9 @@ class MetadataClassifier:
             return 'Blood'
 
         # 检查组织
-        if any(keyword in combined_text for keyword in self.tissue_keywords):
+        if is_tissue:
             # 尝试提取具体组织类型
-            tissue_match = re.search(
-                r'(liver|kidney|lung|brain|heart|breast|ovary|prostate|colon|'
-                r'tumor|tumour|cancer|melanoma)',
-                combined_text,
-                re.IGNORECASE
-            )
+            tissue_match = self._tissue_name_re.search(combined_text)
             if tissue_match:
                 tissue_name = tissue_match.group(1).capitalize()
                 return f'Tissue ({tissue_name})'
@@ -223,15 +484,32 @@ class MetadataClassifier:
         ]
         combined_text = ' '.join(text_fields).lower()
 
-        # 检查是否是健康对照
-        is_healthy = any(
-            keyword in combined_text
-            for keyword in self.healthy_keywords
-        )
+        if self.automaton is not None:
+            # 健康对照与各疾病类别共享同一次自动机扫描
+            categories = self._match_categories(combined_text)
+            is_healthy = 'healthy' in categories
+        else:
+            categories = None
+            tokens = frozenset(combined_text.upper().split())
+            is_healthy = self._keyword_hit(
+                tokens, self.healthy_tokens, self.healthy_re, combined_text)
 
+        # 检查是否是健康对照（健康对照无需再扫描疾病类别）
         if is_healthy or 'not available' in combined_text or 'not applicable' in combined_text:
             return 'Healthy/Control', 'Healthy', True
 
+        if categories is not None:
+            has_cancer = 'cancer' in categories
+            has_neurodegenerative = 'neurodegenerative' in categories
+            has_infectious = 'infectious' in categories
+        else:
+            has_cancer = self._keyword_hit(
+                tokens, self.cancer_tokens, self.cancer_re, combined_text)
+            has_neurodegenerative = self._keyword_hit(
+                tokens, self.neurodegenerative_tokens, self.neurodegenerative_re, combined_text)
+            has_infectious = self._keyword_hit(
+                tokens, self.infectious_tokens, self.infectious_re, combined_text)
+
         # 提取疾病类型（优先使用diseases字段）
         disease_type = str(row.get('diseases', ''))
         if not disease_type or disease_type == 'nan':
@@ -243,18 +521,21 @@ class MetadataClassifier:
         # 分类疾病类别
         disease_category = 'Other'
 
-        if any(keyword in combined_text for keyword in self.cancer_keywords):
+        if has_cancer:
             disease_category = 'Cancer'
-        elif any(keyword in combined_text for keyword in self.neurodegenerative_keywords):
+        elif has_neurodegenerative:
             disease_category = 'Neurodegenerative'
-        elif any(keyword in combined_text for keyword in self.infectious_keywords):
+        elif has_infectious:
             disease_category = 'Infectious Disease'
 
         return disease_type, disease_category, False
 
-    def classify_all(self, df: pd.DataFrame) -> pd.DataFrame:
+    def classify_all_vectorized(self, df: pd.DataFrame) -> pd.DataFrame:
         """
-        对所有数据集进行分类
+        向量化执行HLA类型、样本类型、疾病类型分类
+
+        每个关键词组只对拼接后的文本Series做一次str.contains扫描，
+        避免逐行apply的Python级别开销
 
         Args:
             df: 输入DataFrame
@@ -262,39 +543,152 @@ class MetadataClassifier:
         Returns:
             添加了分类列的DataFrame
         """
-        print(f"\n{'='*60}")
-        print(f"Classifying {len(df)} datasets")
-        print(f"{'='*60}\n")
-
         # HLA类型分类
         print("Classifying HLA types...")
-        hla_results = df.apply(self.classify_hla_type, axis=1)
-        df['hla_type'] = hla_results.apply(lambda x: x[0])
-        df['hla_needs_review'] = hla_results.apply(lambda x: x[1])
+        combined_hla = self._combine_text_columns(df, [
+            'title', 'description', 'keywords', 'project_tags', 'sample_protocol'
+        ])
+        hla_contains = self._dedup_contains_factory(combined_hla)
+        is_hla = hla_contains(self.hla_general_re)
+        has_hla_i = hla_contains(self.hla_i_re) & is_hla
+        has_hla_ii = hla_contains(self.hla_ii_re) & is_hla
+
+        df['hla_type'] = np.select(
+            [has_hla_i & has_hla_ii, has_hla_i, has_hla_ii, is_hla],
+            ['HLA I/II', 'HLA I', 'HLA II', 'HLA (需人工确认)'],
+            default='Non-HLA'
+        )
+        df['hla_needs_review'] = is_hla & ~has_hla_i & ~has_hla_ii
 
         # 样本类型分类
         print("Classifying sample types...")
-        df['sample_type'] = df.apply(self.classify_sample_type, axis=1)
+        combined_sample = self._combine_text_columns(df, [
+            'tissues', 'cell_types', 'sdrf_organism part',
+            'sdrf_cell type', 'sdrf_cell line', 'title', 'description'
+        ])
+        sample_contains = self._dedup_contains_factory(combined_sample)
+        is_cell_line = sample_contains(self.cell_line_re)
+        is_blood = sample_contains(self.blood_re)
+        is_tissue = sample_contains(self.tissue_re)
+
+        # 提取具体的细胞系/组织名称
+        cell_line_name = combined_sample.str.extract(
+            self._cell_line_name_re, expand=False
+        )
+        tissue_name = combined_sample.str.extract(
+            self._tissue_name_re, expand=False
+        ).str.capitalize()
+
+        cell_line_label = np.where(
+            cell_line_name.notna(),
+            'Cell line (' + cell_line_name.fillna('') + ')',
+            'Cell line'
+        )
+        blood_label = np.select(
+            [
+                sample_contains('pbmc'),
+                sample_contains('plasma'),
+                sample_contains('serum'),
+            ],
+            ['Blood (PBMC)', 'Blood (Plasma)', 'Blood (Serum)'],
+            default='Blood'
+        )
+        tissue_label = np.where(
+            tissue_name.notna(),
+            'Tissue (' + tissue_name.fillna('') + ')',
+            'Tissue'
+        )
+
+        # 没有匹配到关键词但tissues字段非空时，直接使用tissues字段
+        if 'tissues' in df.columns:
+            tissues_str = df['tissues'].fillna('').astype(str)
+        else:
+            tissues_str = pd.Series('', index=df.index)
+        has_tissue_field = (
+            tissues_str.str.strip().ne('') & tissues_str.ne('nan')
+        )
+        tissue_field_label = 'Tissue (' + tissues_str.str.slice(0, 50) + ')'
+
+        df['sample_type'] = np.select(
+            [is_cell_line, is_blood, is_tissue, has_tissue_field],
+            [cell_line_label, blood_label, tissue_label, tissue_field_label],
+            default='Unknown'
+        )
 
         # 疾病类型分类
         print("Classifying disease types...")
-        disease_results = df.apply(self.classify_disease_type, axis=1)
-        df['disease_type'] = disease_results.apply(lambda x: x[0])
-        df['disease_category'] = disease_results.apply(lambda x: x[1])
-        df['is_healthy'] = disease_results.apply(lambda x: x[2])
+        combined_disease = self._combine_text_columns(df, [
+            'diseases', 'sdrf_disease', 'title', 'description'
+        ])
+        disease_contains = self._dedup_contains_factory(combined_disease)
+        is_healthy = (
+            disease_contains(self.healthy_re) |
+            disease_contains(self.no_disease_re)
+        )
+
+        # 提取疾病类型（优先使用diseases字段）
+        if 'diseases' in df.columns:
+            diseases_str = df['diseases'].fillna('').astype(str)
+        else:
+            diseases_str = pd.Series('', index=df.index)
+        if 'sdrf_disease' in df.columns:
+            sdrf_disease_str = df['sdrf_disease'].fillna('').astype(str)
+        else:
+            sdrf_disease_str = pd.Series('', index=df.index)
+        has_diseases = diseases_str.str.strip().ne('') & diseases_str.ne('nan')
+        has_sdrf_disease = sdrf_disease_str.str.strip().ne('') & sdrf_disease_str.ne('nan')
+
+        df['disease_type'] = np.select(
+            [is_healthy, has_diseases, has_sdrf_disease],
+            ['Healthy/Control', diseases_str, sdrf_disease_str],
+            default='Unknown'
+        )
+
+        # 健康对照与疾病类别在同一个np.select里完成，
+        # is_healthy掩码只计算一次并同时用于disease_type和is_healthy列
+        df['disease_category'] = np.select(
+            [
+                is_healthy,
+                disease_contains(self.cancer_re),
+                disease_contains(self.neurodegenerative_re),
+                disease_contains(self.infectious_re),
+            ],
+            ['Healthy', 'Cancer', 'Neurodegenerative', 'Infectious Disease'],
+            default='Other'
+        )
+        df['is_healthy'] = is_healthy
+
+        return df
+
+    def classify_all(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        对所有数据集进行分类
+
+        Args:
+            df: 输入DataFrame
+
+        Returns:
+            添加了分类列的DataFrame
+        """
+        print(f"\n{'='*60}")
+        print(f"Classifying {len(df)} datasets")
+        print(f"{'='*60}\n")
+
+        # 向量化分类（HLA类型、样本类型、疾病类型）
+        df = self.classify_all_vectorized(df)
 
         # 数据质量评分
         print("Calculating data quality scores...")
-        df['metadata_quality'] = df.apply(self._calculate_quality_score, axis=1)
-
-        # 标记需要人工审核的数据集
-        df['needs_manual_review'] = (
-            df['hla_needs_review'] |
-            (df['hla_type'] == 'HLA (需人工确认)') |
-            (df['sample_type'] == 'Unknown') |
-            (df['disease_type'] == 'Unknown') |
-            df.get('manual_review', False).fillna(False)
-        )
+        df['metadata_quality'] = self._calculate_quality_scores_vectorized(df)
+
+        # 低基数字符串列转为Categorical
+        # 整数编码让value_counts/比较更快，同时显著降低内存占用
+        for col in ('hla_type', 'sample_type', 'disease_type',
+                    'disease_category', 'metadata_quality'):
+            df[col] = df[col].astype('category')
+
+        # 标记需要人工审核的数据集（在Categorical整数编码上做按位运算）
+        df['needs_manual_review'] = self._flag_needs_manual_review(df)
 
         print("\n✓ Classification complete!")
 
@@ -303,6 +697,122 @@ class MetadataClassifier:
 
         return df
 
+    def _classify_chunk(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """对单个分块执行逐行分类（并行路径的工作单元）"""
+        if chunk.empty:
+            return chunk
+
+        hla_results = chunk.apply(self.classify_hla_type, axis=1)
+        chunk['hla_type'], chunk['hla_needs_review'] = zip(*hla_results)
+
+        chunk['sample_type'] = chunk.apply(self.classify_sample_type, axis=1)
+
+        disease_results = chunk.apply(self.classify_disease_type, axis=1)
+        chunk['disease_type'], chunk['disease_category'], chunk['is_healthy'] = (
+            zip(*disease_results)
+        )
+
+        chunk['metadata_quality'] = chunk.apply(self._calculate_quality_score, axis=1)
+        return chunk
+
+    def classify_all_parallel(self, df: pd.DataFrame, n_jobs: int = -1) -> pd.DataFrame:
+        """
+        分块并行执行逐行分类
+
+        向量化路径之外的备选方案：把DataFrame按CPU核数切块，
+        用joblib把逐行分类分摊到多个进程（joblib缺失时退化为串行）
+
+        Args:
+            df: 输入DataFrame
+            n_jobs: 并行进程数（-1表示全部核心）
+
+        Returns:
+            添加了分类列的DataFrame
+        """
+        print(f"\n{'='*60}")
+        print(f"Classifying {len(df)} datasets (chunked parallel)")
+        print(f"{'='*60}\n")
+
+        n_chunks = max(1, min(os.cpu_count() or 1, len(df)))
+        bounds = np.array_split(np.arange(len(df)), n_chunks)
+        chunks = [df.iloc[idx] for idx in bounds if len(idx)]
+
+        if JOBLIB_AVAILABLE and n_chunks > 1:
+            results = Parallel(n_jobs=n_jobs)(
+                delayed(self._classify_chunk)(chunk) for chunk in chunks
+            )
+        else:
+            results = [self._classify_chunk(chunk) for chunk in chunks]
+
+        df = pd.concat(results)
+
+        # 标记需要人工审核的数据集（与classify_all一致）
+        df['needs_manual_review'] = self._flag_needs_manual_review(df)
+
+        print("\n✓ Classification complete!")
+        self._print_statistics(df)
+        return df
+
+    @staticmethod
+    def _category_mask(series: pd.Series, value: str) -> np.ndarray:
+        """等值比较：Categorical列直接比较int8编码，其他列退回字符串比较"""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            if value not in categories:
+                return np.zeros(len(series), dtype=bool)
+            return series.cat.codes.to_numpy() == categories.get_loc(value)
+        return series.eq(value).fillna(False).to_numpy(dtype=bool)
+
+    def _flag_needs_manual_review(self, df: pd.DataFrame) -> np.ndarray:
+        """用numpy按位运算合并各个人工审核条件"""
+        needs_review = (
+            df['hla_needs_review'].fillna(False).to_numpy(dtype=bool) |
+            self._category_mask(df['hla_type'], 'HLA (需人工确认)') |
+            self._category_mask(df['sample_type'], 'Unknown') |
+            self._category_mask(df['disease_type'], 'Unknown')
+        )
+        if 'manual_review' in df.columns:
+            needs_review |= df['manual_review'].fillna(False).to_numpy(dtype=bool)
+        return needs_review
+
+    def _calculate_quality_scores_vectorized(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        向量化计算全表的元数据质量评分
+
+        与_calculate_quality_score逻辑一致，但用一个布尔矩阵一次性
+        统计非空字段数，避免逐行apply
+
+        Args:
+            df: 输入DataFrame
+
+        Returns:
+            质量评分数组 (High/Medium/Low)
+        """
+        key_fields = [
+            'title', 'description', 'diseases', 'tissues',
+            'organisms', 'instruments', 'publication_date'
+        ]
+        present = [col for col in key_fields if col in df.columns]
+
+        if present:
+            values = df[present].astype(str)
+            filled = values.apply(lambda s: s.str.strip().ne('') & s.ne('nan'))
+            score = (filled & df[present].notna()).to_numpy().sum(axis=1)
+        else:
+            score = np.zeros(len(df), dtype=int)
+
+        # 额外加分项（has_sdrf可能是bool也可能是字符串化的'True'，
+        # 显式比较而不是astype(bool)——非空字符串'False'也是truthy）
+        if 'has_sdrf' in df.columns:
+            score = score + df['has_sdrf'].isin([True, 'True']).to_numpy() * 2
+        if 'pubmed_ids' in df.columns:
+            pubmed = df['pubmed_ids'].astype(str)
+            score = score + (
+                df['pubmed_ids'].notna() & pubmed.ne('') & pubmed.ne('nan')
+            ).to_numpy()
+
+        return np.select([score >= 8, score >= 5], ['High', 'Medium'], default='Low')
+
     def _calculate_quality_score(self, row: pd.Series) -> str:
         """
         计算元数据质量评分
@@ -326,8 +836,8 @@ class MetadataClassifier:
             if value and value != 'nan' and value.strip():
                 score += 1
 
-        # 额外加分项
-        if row.get('has_sdrf', False):
+        # 额外加分项（与向量化路径一致，兼容字符串化的'True'）
+        if row.get('has_sdrf', False) in (True, 'True'):
             score += 2
 
         if str(row.get('pubmed_ids', '')) and str(row.get('pubmed_ids', '')) != 'nan':
@@ -342,52 +852,53 @@ class MetadataClassifier:
             return 'Low'
 
     def _print_statistics(self, df: pd.DataFrame):
-        """打印分类统计信息"""
+        """打印分类统计信息（一次melt+groupby得到所有列的分布）"""
         print("\n" + "="*60)
         print("Classification Statistics")
         print("="*60)
 
-        # HLA类型分布
-        print("\nHLA Type Distribution:")
-        hla_counts = df['hla_type'].value_counts()
-        for hla_type, count in hla_counts.items():
-            percentage = (count / len(df)) * 100
-            print(f"  {hla_type}: {count} ({percentage:.1f}%)")
-
-        # 样本类型分布
-        print("\nSample Type Distribution:")
-        sample_counts = df['sample_type'].value_counts()
-        for sample_type, count in sample_counts.head(10).items():
-            percentage = (count / len(df)) * 100
-            print(f"  {sample_type}: {count} ({percentage:.1f}%)")
-
-        # 疾病类别分布
-        print("\nDisease Category Distribution:")
-        disease_counts = df['disease_category'].value_counts()
-        for category, count in disease_counts.items():
-            percentage = (count / len(df)) * 100
-            print(f"  {category}: {count} ({percentage:.1f}%)")
-
-        # 数据质量分布
-        print("\nMetadata Quality Distribution:")
-        quality_counts = df['metadata_quality'].value_counts()
-        for quality, count in quality_counts.items():
-            percentage = (count / len(df)) * 100
-            print(f"  {quality}: {count} ({percentage:.1f}%)")
+        stat_columns = ['hla_type', 'sample_type', 'disease_category', 'metadata_quality']
+        counts = (
+            df[stat_columns].astype(str)
+            .melt(var_name='column', value_name='value')
+            .groupby(['column', 'value'], sort=False)
+            .size()
+        )
+
+        sections = [
+            ('hla_type', 'HLA Type Distribution', None),
+            ('sample_type', 'Sample Type Distribution', 10),
+            ('disease_category', 'Disease Category Distribution', None),
+            ('metadata_quality', 'Metadata Quality Distribution', None),
+        ]
+        total = len(df)
+        for column, title, limit in sections:
+            print(f"\n{title}:")
+            column_counts = counts.loc[column].sort_values(ascending=False)
+            if limit:
+                column_counts = column_counts.head(limit)
+            for value, count in column_counts.items():
+                print(f"  {value}: {count} ({count/total*100:.1f}%)")
 
         # 需要人工审核的数量
         review_count = df['needs_manual_review'].sum()
-        print(f"\nDatasets needing manual review: {review_count} ({(review_count/len(df)*100):.1f}%)")
+        print(f"\nDatasets needing manual review: {review_count} ({(review_count/total*100):.1f}%)")
 
     def save_results(self, df: pd.DataFrame, filename: str):
         """保存结果"""
         csv_path = DATA_PROCESSED_DIR / f"{filename}.csv"
         json_path = DATA_PROCESSED_DIR / f"{filename}.json"
+        parquet_path = DATA_PROCESSED_DIR / f"{filename}.parquet"
 
-        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-        print(f"\n✓ Saved CSV to: {csv_path}")
+        # Parquet作为流水线阶段间的传输格式（列式、带类型、压缩）
+        # CSV/JSON保留给人工查看和外部工具
+        if write_parquet(df, parquet_path):
+            print(f"\n✓ Saved Parquet to: {parquet_path}")
 
-        df.to_json(json_path, orient='records', indent=2, force_ascii=False)
+        write_csv_fast(df, csv_path)
+        print(f"✓ Saved CSV to: {csv_path}")
+
+        write_records_json(df, json_path)
         print(f"✓ Saved JSON to: {json_path}")
 
 
@@ -397,9 +908,11 @@ def main():
     print("Metadata Classification Tool")
     print("="*60 + "\n")
 
-    # 查找输入文件（优先使用enriched版本）
+    # 查找输入文件（优先使用enriched版本；同名Parquet优先于CSV）
     input_files = [
+        DATA_PROCESSED_DIR / "all_metadata_enriched.parquet",
         DATA_PROCESSED_DIR / "all_metadata_enriched.csv",
+        DATA_PROCESSED_DIR / "all_metadata_raw.parquet",
         DATA_PROCESSED_DIR / "all_metadata_raw.csv",
     ]
 
@@ -415,7 +928,7 @@ def main():
         sys.exit(1)
 
     print(f"Loading metadata from: {input_file}")
-    df = pd.read_csv(input_file)
+    df = as_arrow_strings(read_table(input_file))
     print(f"✓ Loaded {len(df)} datasets")
 
     # 执行分类
@@ -4,12 +4,24 @@
 从JSON格式提取疾病名称，统一格式
 """
 
+import numpy as np
 import pandas as pd
 import re
 import json
 from pathlib import Path
 from typing import List, Optional
 
+from classify_metadata import (
+    as_arrow_strings, read_csv_fast, read_table,
+    write_csv_fast, write_parquet, write_records_json
+)
+
+try:
+    import xlsxwriter  # noqa: F401
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+
 # 项目路径配置
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
@@ -25,6 +37,44 @@ class DiseaseTypeCleaner:
             'Disease': 'Unknown',  # 过于通用的术语
         }
 
+        # 预编译name字段提取正则，避免每次调用重新编译
+        self._name_re = re.compile(r'"name":\s*"([^"]+)"')
+
+        # 疾病类别关键词（小写），每组合并为一个alternation正则
+        # 重新分类时每组只需一次C级扫描
+        self.cancer_keywords = [
+            'cancer', 'carcinoma', 'melanoma', 'leukemia', 'lymphoma',
+            'sarcoma', 'glioblastoma', 'neuroblastoma', 'adenocarcinoma',
+            'neoplasm', 'tumor', 'tumour'
+        ]
+        self.neurodegenerative_keywords = [
+            'alzheimer', 'parkinson', 'dementia', 'multiple sclerosis',
+            'als', 'huntington'
+        ]
+        self.infectious_keywords = [
+            'covid', 'sars', 'influenza', 'hiv', 'virus', 'bacterial',
+            'infection', 'tuberculosis', 'hepatitis', 'theileriasis'
+        ]
+        self.autoimmune_keywords = [
+            'rheumatoid', 'lupus', 'arthritis', 'spondylitis',
+            'ankylos', 'autoimmune'
+        ]
+        self.other_disease_keywords = [
+            'diabetes', 'fibrosis', 'chorioretinopathy', 'lyme'
+        ]
+
+        self._cancer_re = self._build_keyword_regex(self.cancer_keywords)
+        self._neurodegenerative_re = self._build_keyword_regex(self.neurodegenerative_keywords)
+        self._infectious_re = self._build_keyword_regex(self.infectious_keywords)
+        self._autoimmune_re = self._build_keyword_regex(self.autoimmune_keywords)
+        self._other_disease_re = self._build_keyword_regex(self.other_disease_keywords)
+        self._healthy_re = re.compile('healthy|control|disease free')
+
+    @staticmethod
+    def _build_keyword_regex(keywords: List[str]) -> re.Pattern:
+        """把关键词列表合并为一个alternation正则"""
+        return re.compile('|'.join(map(re.escape, keywords)))
+
     def extract_disease_name(self, disease_str: str) -> Optional[str]:
         """
         从JSON格式或其他格式中提取疾病名称
@@ -35,7 +85,8 @@ class DiseaseTypeCleaner:
         Returns:
             清理后的疾病名称
         """
-        if not disease_str or pd.isna(disease_str) or str(disease_str).strip() == '':
+        # NaN用自比较判断，避免热路径上的pandas调度开销
+        if not disease_str or disease_str != disease_str or str(disease_str).strip() == '':
             return 'Unknown'
 
         disease_str = str(disease_str).strip()
@@ -67,8 +118,7 @@ class DiseaseTypeCleaner:
         disease_str_json = disease_str.replace("'", '"')
 
         # 尝试提取所有 "name" 字段的值
-        name_pattern = r'"name":\s*"([^"]+)"'
-        matches = re.findall(name_pattern, disease_str_json)
+        matches = self._name_re.findall(disease_str_json)
 
         for match in matches:
             disease_name = match.strip()
@@ -89,6 +139,56 @@ class DiseaseTypeCleaner:
         # 用分号连接
         return '; '.join(disease_names)
 
+    def extract_disease_names_batch(self, values) -> List[str]:
+        """
+        在原生ndarray/列表上批量清理疾病字符串
+
+        绕过pandas的逐元素调度，直接用列表推导遍历底层数组；
+        适合不需要Series对齐的调用方
+
+        Args:
+            values: 疾病字符串的ndarray或列表
+
+        Returns:
+            清理后的疾病名称列表
+        """
+        extract = self.extract_disease_name
+        return [extract(value) for value in values]
+
+    def extract_disease_names_vectorized(self, series: pd.Series) -> pd.Series:
+        """
+        向量化清理一列疾病字符串
+
+        与extract_disease_name逐行结果一致，但JSON格式的行只用一次
+        str.extractall的C级正则扫描提取全部name字段
+
+        Args:
+            series: 疾病字符串Series
+
+        Returns:
+            清理后的疾病名称Series
+        """
+        values = series.fillna('').astype(str).str.strip()
+        result = values.where(values.ne('') & values.ne('nan'), 'Unknown')
+
+        json_mask = values.str.contains("'@type'|\"@type\"", regex=True, na=False)
+        if json_mask.any():
+            names = (
+                values[json_mask]
+                .str.replace("'", '"', regex=False)
+                .str.extractall(self._name_re)[0]
+                .str.strip()
+            )
+            # 应用映射并过滤过于通用的术语
+            names = names.map(lambda name: self.disease_mapping.get(name, name))
+            names = names[names.ne('') & names.ne('Unknown')]
+            joined = names.groupby(level=0).apply(
+                lambda group: '; '.join(sorted(set(group)))
+            )
+            result.loc[json_mask] = 'Unknown'
+            result.loc[joined.index] = joined
+        return result
+
     def standardize_disease_name(self, disease_name: str) -> str:
         """
         标准化疾病名称
@@ -128,14 +228,14 @@ class DiseaseTypeCleaner:
         if 'disease_type' in df.columns:
             print("Cleaning 'disease_type' column...")
             df['disease_type_original'] = df['disease_type'].copy()
-            df['disease_type'] = df['disease_type'].apply(self.extract_disease_name)
+            df['disease_type'] = self.extract_disease_names_vectorized(df['disease_type'])
             print("✓ Cleaned 'disease_type' column")
 
         # 清理diseases字段（如果存在）
         if 'diseases' in df.columns:
             print("Cleaning 'diseases' column...")
             df['diseases_original'] = df['diseases'].copy()
-            df['diseases'] = df['diseases'].apply(self.extract_disease_name)
+            df['diseases'] = self.extract_disease_names_vectorized(df['diseases'])
             print("✓ Cleaned 'diseases' column")
 
         # 重新分类疾病类别（基于清理后的数据）
@@ -148,60 +248,33 @@ class DiseaseTypeCleaner:
         return df
 
     def _reclassify_disease_categories(self, df: pd.DataFrame) -> pd.DataFrame:
-        """重新分类疾病类别"""
-        cancer_keywords = [
-            'cancer', 'carcinoma', 'melanoma', 'leukemia', 'lymphoma',
-            'sarcoma', 'glioblastoma', 'neuroblastoma', 'adenocarcinoma',
-            'neoplasm', 'tumor', 'tumour'
-        ]
-
-        neurodegenerative_keywords = [
-            'alzheimer', 'parkinson', 'dementia', 'multiple sclerosis',
-            'als', 'huntington'
-        ]
-
-        infectious_keywords = [
-            'covid', 'sars', 'influenza', 'hiv', 'virus', 'bacterial',
-            'infection', 'tuberculosis', 'hepatitis', 'theileriasis'
-        ]
-
-        autoimmune_keywords = [
-            'rheumatoid', 'lupus', 'arthritis', 'spondylitis',
-            'ankylos', 'autoimmune'
-        ]
-
-        other_disease_keywords = [
-            'diabetes', 'fibrosis', 'chorioretinopathy', 'lyme'
-        ]
-
-        def classify_category(row):
-            disease = str(row.get('disease_type', '')).lower()
-
-            if disease in ['unknown', 'nan', '']:
-                return 'Unknown'
-
-            if 'healthy' in disease or 'control' in disease or 'disease free' in disease:
-                return 'Healthy'
-
-            # 检查各类疾病
-            if any(keyword in disease for keyword in cancer_keywords):
-                return 'Cancer'
-
-            if any(keyword in disease for keyword in neurodegenerative_keywords):
-                return 'Neurodegenerative'
-
-            if any(keyword in disease for keyword in infectious_keywords):
-                return 'Infectious Disease'
-
-            if any(keyword in disease for keyword in autoimmune_keywords):
-                return 'Autoimmune Disease'
-
-            if any(keyword in disease for keyword in other_disease_keywords):
-                return 'Metabolic/Other Disease'
-
-            return 'Other'
-
-        df['disease_category'] = df.apply(classify_category, axis=1)
+        """重新分类疾病类别（每组关键词一次向量化正则扫描）"""
+        if 'disease_type' in df.columns:
+            disease = df['disease_type'].fillna('').astype(str).str.lower()
+        else:
+            disease = pd.Series('', index=df.index)
+
+        df['disease_category'] = np.select(
+            [
+                disease.isin(['unknown', 'nan', '']),
+                disease.str.contains(self._healthy_re, regex=True, na=False),
+                disease.str.contains(self._cancer_re, regex=True, na=False),
+                disease.str.contains(self._neurodegenerative_re, regex=True, na=False),
+                disease.str.contains(self._infectious_re, regex=True, na=False),
+                disease.str.contains(self._autoimmune_re, regex=True, na=False),
+                disease.str.contains(self._other_disease_re, regex=True, na=False),
+            ],
+            [
+                'Unknown',
+                'Healthy',
+                'Cancer',
+                'Neurodegenerative',
+                'Infectious Disease',
+                'Autoimmune Disease',
+                'Metabolic/Other Disease',
+            ],
+            default='Other'
+        )
 
         return df
 
@@ -238,18 +311,31 @@ class DiseaseTypeCleaner:
         csv_path = DATA_PROCESSED_DIR / f"{filename}.csv"
         json_path = DATA_PROCESSED_DIR / f"{filename}.json"
         excel_path = DATA_PROCESSED_DIR / f"{filename}.xlsx"
+        parquet_path = DATA_PROCESSED_DIR / f"{filename}.parquet"
+
+        # Parquet作为下游阶段的首选输入格式
+        if write_parquet(df, parquet_path):
+            print(f"\n✓ Saved Parquet to: {parquet_path}")
 
         # 保存CSV
-        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+        write_csv_fast(df, csv_path)
         print(f"\n✓ Saved CSV to: {csv_path}")
 
         # 保存JSON
-        df.to_json(json_path, orient='records', indent=2, force_ascii=False)
+        write_records_json(df, json_path)
         print(f"✓ Saved JSON to: {json_path}")
 
         # 保存Excel（只包含主要列，不包含original列）
+        # xlsxwriter的constant_memory模式按行流式写盘，避免openpyxl整棵XML树驻留内存
         main_columns = [col for col in df.columns if not col.endswith('_original')]
-        df[main_columns].to_excel(excel_path, index=False)
+        if XLSXWRITER_AVAILABLE:
+            with pd.ExcelWriter(
+                excel_path, engine='xlsxwriter',
+                engine_kwargs={'options': {'constant_memory': True}}
+            ) as writer:
+                df[main_columns].to_excel(writer, index=False)
+        else:
+            df[main_columns].to_excel(excel_path, index=False)
         print(f"✓ Saved Excel to: {excel_path}")
 
 
@@ -259,15 +345,17 @@ def main():
     print("Disease Type Cleaning Tool")
     print("="*60 + "\n")
 
-    # 读取分类后的元数据
-    input_file = DATA_PROCESSED_DIR / "all_metadata_classified.csv"
+    # 读取分类后的元数据（Parquet中间文件优先于CSV）
+    input_file = DATA_PROCESSED_DIR / "all_metadata_classified.parquet"
+    if not input_file.exists():
+        input_file = DATA_PROCESSED_DIR / "all_metadata_classified.csv"
 
     if not input_file.exists():
         print(f"✗ Error: {input_file} not found!")
         return
 
     print(f"Loading data from: {input_file}")
-    df = pd.read_csv(input_file)
+    df = as_arrow_strings(read_table(input_file))
     print(f"✓ Loaded {len(df)} datasets\n")
 
     # 显示清理前的示例
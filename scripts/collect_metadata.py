@@ -8,12 +8,55 @@ import os
 import sys
 import json
 import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
 from pathlib import Path
 from typing import Dict, List, Optional
 from datetime import datetime
 
+# 可选：aiohttp用于并发抓取PRIDE API（不可用时回退到顺序请求）
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# 可选：httpx用于HTTP/2多路复用（PRIDE项目接口、SDRF批量探测）
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+    _REQUEST_ERRORS = (requests.exceptions.RequestException, httpx.HTTPError)
+except ImportError:
+    HTTPX_AVAILABLE = False
+    _REQUEST_ERRORS = (requests.exceptions.RequestException,)
+
+# 可选：pyarrow用于把各仓库子表直接在Arrow侧合并写入单个Parquet
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 可选：orjson（C实现）解析/序列化PRIDE响应，比标准库json快数倍
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# 并发请求上限（同时起到速率限制作用）
+PRIDE_CONCURRENCY = 16
+
+# 数据集ID前缀：tuple形式供startswith走C级单循环快路径；
+# 前3个字符即可唯一区分四个仓库，供分桶查表用
+REPO_PREFIXES = ('PXD', 'MSV', 'JPST', 'PASS')
+PREFIX_MAP = {'PXD': 'PXD', 'MSV': 'MSV', 'JPS': 'JPST', 'PAS': 'PASS'}
+
 # 项目路径配置
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_RAW_DIR = PROJECT_ROOT / "data" / "raw"
@@ -30,67 +73,280 @@ for dir_path in [PRIDE_API_DIR, SDRF_DIR, MANUAL_DIR, DATA_PROCESSED_DIR]:
 class ProteomicsMetadataCollector:
     """蛋白质组学元数据收集器"""
 
+    # 列表型字段的提取规格：(输出字段, API字段, 子字段)
+    # 统一由一个推导式驱动，避免逐字段手写提取调用
+    _LIST_FIELDS = (
+        ('organisms', 'organisms', 'name'),
+        ('diseases', 'diseases', None),
+        ('tissues', 'tissues', None),
+        ('cell_types', 'cellTypes', None),
+        ('instruments', 'instruments', 'name'),
+        ('ptms', 'ptmList', 'name'),
+        ('quantification_methods', 'quantificationMethods', 'name'),
+        ('project_tags', 'projectTags', None),
+        ('keywords', 'keywords', None),
+    )
+
     def __init__(self):
         self.pride_base_url = "https://www.ebi.ac.uk/pride/ws/archive/v2"
         self.session = requests.Session()
         self.session.headers.update({'Accept': 'application/json'})
 
+        # 连接池加大并启用keep-alive，重试（含指数退避）交给urllib3处理
+        adapter = HTTPAdapter(
+            pool_connections=32, pool_maxsize=64,
+            max_retries=Retry(
+                total=3, backoff_factor=1,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET', 'HEAD']))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # PRIDE项目接口走HTTP/2：多个请求在同一条连接上多路复用，
+        # 既省握手又避免HTTP/1.1的队头阻塞（线程池并发时尤其有效）
+        self.http2_client = None
+        if HTTPX_AVAILABLE:
+            self.http2_client = httpx.Client(
+                http2=True,
+                headers={'Accept': 'application/json'},
+                timeout=httpx.Timeout(30.0),
+                limits=httpx.Limits(max_connections=4))
+
     def read_dataset_list(self, file_path: str) -> List[str]:
         """读取数据集ID列表"""
         datasets = []
         with open(file_path, 'r', encoding='utf-8') as f:
             for line in f:
                 dataset_id = line.strip()
-                if dataset_id and len(dataset_id) > 3:
+                # tuple参数的startswith在C层一次遍历所有前缀
+                if dataset_id.startswith(REPO_PREFIXES) and len(dataset_id) > 3:
                     datasets.append(dataset_id)
         return datasets
 
-    def get_pride_metadata(self, pxd_id: str, retry: int = 3) -> Optional[Dict]:
+    def get_pride_metadata(self, pxd_id: str) -> Optional[Dict]:
         """
         从PRIDE API获取单个数据集的元数据
 
+        重试（含指数退避和429/5xx处理）由Session上挂载的urllib3 Retry完成，
+        这里只处理最终结果。
+
         Args:
             pxd_id: ProteomeXchange数据集ID (如 PXD012348)
-            retry: 重试次数
 
         Returns:
             元数据字典，如果失败返回None
         """
         url = f"{self.pride_base_url}/projects/{pxd_id}"
+        cond_headers = self._conditional_headers(pxd_id)
 
-        for attempt in range(retry):
-            try:
-                print(f"  Fetching {pxd_id} (attempt {attempt + 1}/{retry})...")
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
+        # 优先用HTTP/2客户端，不可用时退回requests.Session
+        client = self.http2_client if self.http2_client is not None else self.session
 
+        try:
+            print(f"  Fetching {pxd_id}...")
+            response = client.get(url, timeout=30, headers=cond_headers)
+
+            # 304：服务端确认未变化，直接复用本地缓存
+            if response.status_code == 304:
+                print(f"  ↷ {pxd_id} unchanged (304), using cached response")
+                return self._load_cached_json(pxd_id)
+            if response.status_code == 404:
+                print(f"  ✗ {pxd_id} not found (404)")
+                return None
+
+            response.raise_for_status()
+
+            # 直接在原始字节上解析，省掉response.json()的中间解码
+            if ORJSON_AVAILABLE:
+                data = orjson.loads(response.content)
+            else:
                 data = response.json()
 
-                # 保存原始API响应
-                output_file = PRIDE_API_DIR / f"{pxd_id}.json"
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=2, ensure_ascii=False)
+            # 保存原始API响应和ETag（供下次条件请求使用）
+            self._save_raw_json(pxd_id, data, etag=response.headers.get('ETag'))
+
+            print(f"  ✓ Successfully fetched {pxd_id}")
+            return data
+
+        except _REQUEST_ERRORS as e:
+            print(f"  ! Request error for {pxd_id}: {e}")
+        except json.JSONDecodeError as e:
+            print(f"  ! JSON decode error for {pxd_id}: {e}")
+
+        print(f"  ✗ Failed to fetch {pxd_id}")
+        return None
+
+    def _save_raw_json(self, pxd_id: str, data: Dict, etag: Optional[str] = None):
+        """保存原始API响应到本地，附带ETag侧文件用于条件请求"""
+        output_file = PRIDE_API_DIR / f"{pxd_id}.json"
+        if ORJSON_AVAILABLE:
+            output_file.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        else:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+        if etag:
+            output_file.with_suffix('.etag').write_text(etag, encoding='utf-8')
+
+    def _conditional_headers(self, pxd_id: str) -> Dict[str, str]:
+        """若本地已有缓存响应和ETag，构造If-None-Match条件请求头"""
+        json_file = PRIDE_API_DIR / f"{pxd_id}.json"
+        etag_file = json_file.with_suffix('.etag')
+        if json_file.exists() and etag_file.exists():
+            return {'If-None-Match': etag_file.read_text(encoding='utf-8').strip()}
+        return {}
+
+    def _load_cached_json(self, pxd_id: str) -> Optional[Dict]:
+        """读取本地缓存的API响应"""
+        json_file = PRIDE_API_DIR / f"{pxd_id}.json"
+        try:
+            if ORJSON_AVAILABLE:
+                return orjson.loads(json_file.read_bytes())
+            with open(json_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"  ! Failed to read cached response for {pxd_id}: {e}")
+            return None
+
+    async def _get_pride_metadata_async(self, session, pxd_id: str,
+                                        retry: int = 3) -> Optional[Dict]:
+        """get_pride_metadata的异步版本，共享同一个aiohttp会话"""
+        url = f"{self.pride_base_url}/projects/{pxd_id}"
+        cond_headers = self._conditional_headers(pxd_id)
+
+        for attempt in range(retry):
+            try:
+                async with session.get(
+                        url, timeout=aiohttp.ClientTimeout(total=30),
+                        headers=cond_headers) as response:
+                    if response.status == 304:
+                        print(f"  ↷ {pxd_id} unchanged (304), using cached response")
+                        return await asyncio.to_thread(self._load_cached_json, pxd_id)
+                    if response.status == 404:
+                        print(f"  ✗ {pxd_id} not found (404)")
+                        return None
+                    if response.status == 429:
+                        # 服务端限流时按Retry-After等待后重试
+                        retry_after = float(response.headers.get('Retry-After', 2 ** attempt))
+                        print(f"  ! Rate limited for {pxd_id}, waiting {retry_after}s")
+                        await asyncio.sleep(retry_after)
+                        continue
+                    response.raise_for_status()
+                    if ORJSON_AVAILABLE:
+                        data = await response.json(loads=orjson.loads)
+                    else:
+                        data = await response.json()
+                    etag = response.headers.get('ETag')
+
+                # 文件写入放到线程池，避免阻塞事件循环
+                await asyncio.to_thread(self._save_raw_json, pxd_id, data, etag)
 
                 print(f"  ✓ Successfully fetched {pxd_id}")
                 return data
 
-            except requests.exceptions.HTTPError as e:
-                if response.status_code == 404:
-                    print(f"  ✗ {pxd_id} not found (404)")
-                    return None
-                print(f"  ! HTTP error for {pxd_id}: {e}")
-            except requests.exceptions.RequestException as e:
+            except aiohttp.ClientError as e:
                 print(f"  ! Request error for {pxd_id}: {e}")
-            except json.JSONDecodeError as e:
+            except (json.JSONDecodeError, ValueError) as e:
                 print(f"  ! JSON decode error for {pxd_id}: {e}")
 
             if attempt < retry - 1:
-                time.sleep(2 ** attempt)  # 指数退避
+                await asyncio.sleep(2 ** attempt)  # 指数退避
 
         print(f"  ✗ Failed to fetch {pxd_id} after {retry} attempts")
         return None
 
-    def extract_metadata_fields(self, pxd_id: str, data: Dict) -> Dict:
+    async def _download_sdrf_async(self, session, pxd_id: str) -> tuple:
+        """download_sdrf的异步版本，同样由GET结果推断文件是否存在"""
+        sdrf_url = f"https://www.ebi.ac.uk/pride/data/archive/{pxd_id}/{pxd_id}.sdrf.tsv"
+        output_file = SDRF_DIR / f"{pxd_id}.sdrf.tsv"
+
+        # 如果文件已存在，跳过
+        if output_file.exists():
+            print(f"  ↷ SDRF already exists for {pxd_id}")
+            return str(output_file), True
+
+        try:
+            print(f"  Downloading SDRF for {pxd_id}...")
+            async with session.get(
+                    sdrf_url, timeout=aiohttp.ClientTimeout(total=60)) as response:
+                if response.status == 404:
+                    return None, False
+                response.raise_for_status()
+                # 原始字节直接落盘，跳过decode+re-encode
+                body = await response.read()
+
+            await asyncio.to_thread(output_file.write_bytes, body)
+
+            print(f"  ✓ SDRF downloaded for {pxd_id}")
+            return str(output_file), True
+
+        except aiohttp.ClientError as e:
+            print(f"  ✗ Failed to download SDRF for {pxd_id}: {e}")
+            return None, False
+
+    async def _check_sdrf_batch(self, pxd_ids: List[str]) -> Dict[str, bool]:
+        """
+        批量探测SDRF文件是否存在
+
+        所有HEAD请求通过httpx的HTTP/2多路复用共享一条TCP/TLS连接，
+        免去逐个探测时的握手开销。
+        """
+        urls = {
+            pxd_id: f"https://www.ebi.ac.uk/pride/data/archive/{pxd_id}/{pxd_id}.sdrf.tsv"
+            for pxd_id in pxd_ids
+        }
+        limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+        async with httpx.AsyncClient(http2=True, limits=limits, timeout=10) as client:
+            responses = await asyncio.gather(
+                *(client.head(url) for url in urls.values()),
+                return_exceptions=True)
+        return {
+            pxd_id: (not isinstance(resp, Exception) and resp.status_code == 200)
+            for pxd_id, resp in zip(urls, responses)
+        }
+
+    async def _collect_one(self, sem, session, pxd_id: str,
+                           sdrf_flags: Optional[Dict[str, bool]] = None) -> Dict:
+        """抓取单个PXD数据集的元数据和SDRF（信号量限制并发）"""
+        async with sem:
+            raw_data = await self._get_pride_metadata_async(session, pxd_id)
+
+            if not raw_data:
+                return {
+                    'dataset_id': pxd_id,
+                    'repository': 'PRIDE',
+                    'error': 'Failed to fetch metadata'
+                }
+
+            # 批量探测结果说没有时直接跳过；否则GET一次，
+            # 404即推断为没有SDRF（无需单独的HEAD探测）
+            if sdrf_flags is not None and not sdrf_flags.get(pxd_id, False):
+                sdrf_path, has_sdrf = None, False
+            else:
+                sdrf_path, has_sdrf = await self._download_sdrf_async(session, pxd_id)
+
+            metadata = self.extract_metadata_fields(pxd_id, raw_data, has_sdrf=has_sdrf)
+            metadata['sdrf_file'] = sdrf_path if sdrf_path else ''
+
+            return metadata
+
+    async def _collect_pxd_async(self, pxd_datasets: List[str]) -> List[Dict]:
+        """并发收集所有PXD数据集"""
+        # 先用一条HTTP/2连接批量探测SDRF，后续协程直接查表
+        sdrf_flags = None
+        if HTTPX_AVAILABLE:
+            print(f"Probing SDRF availability for {len(pxd_datasets)} datasets (HTTP/2)...")
+            sdrf_flags = await self._check_sdrf_batch(pxd_datasets)
+            print(f"  ✓ {sum(sdrf_flags.values())} datasets have SDRF files\n")
+
+        sem = asyncio.Semaphore(PRIDE_CONCURRENCY)
+        async with aiohttp.ClientSession(
+                headers={'Accept': 'application/json'}) as session:
+            return list(await asyncio.gather(
+                *(self._collect_one(sem, session, pxd_id, sdrf_flags)
+                  for pxd_id in pxd_datasets)))
+
+    def extract_metadata_fields(self, pxd_id: str, data: Dict,
+                                has_sdrf: bool = False) -> Dict:
         """
         从PRIDE API响应中提取关键元数据字段
 
@@ -101,46 +357,43 @@ class ProteomicsMetadataCollector:
         Returns:
             提取的元数据字典
         """
+        get = data.get
+        references = get('references', ())
+
         metadata = {
             'dataset_id': pxd_id,
             'repository': 'PRIDE',
-            'title': data.get('title', ''),
-            'description': data.get('projectDescription', ''),
-
-            # 生物学信息
-            'organisms': self._extract_list(data.get('organisms', []), 'name'),
-            'diseases': self._extract_list(data.get('diseases', [])),
-            'tissues': self._extract_list(data.get('tissues', [])),
-            'cell_types': self._extract_list(data.get('cellTypes', [])),
-
-            # 技术信息
-            'instruments': self._extract_list(data.get('instruments', []), 'name'),
-            'ptms': self._extract_list(data.get('ptmList', []), 'name'),
-            'quantification_methods': self._extract_list(data.get('quantificationMethods', []), 'name'),
+            'title': get('title', ''),
+            'description': get('projectDescription', ''),
+        }
 
-            # 项目标签和关键词
-            'project_tags': self._extract_list(data.get('projectTags', [])),
-            'keywords': self._extract_list(data.get('keywords', [])),
+        # 生物学/技术/标签等列表型字段统一按规格表提取
+        extract_list = self._extract_list
+        metadata.update({
+            out_key: extract_list(get(in_key, ()), subfield)
+            for out_key, in_key, subfield in self._LIST_FIELDS
+        })
 
+        metadata.update({
             # 实验方案
-            'sample_protocol': data.get('sampleProcessingProtocol', ''),
-            'data_protocol': data.get('dataProcessingProtocol', ''),
+            'sample_protocol': get('sampleProcessingProtocol', ''),
+            'data_protocol': get('dataProcessingProtocol', ''),
 
             # 日期和出版
-            'publication_date': data.get('publicationDate', ''),
-            'submission_date': data.get('submissionDate', ''),
-            'submission_type': data.get('submissionType', ''),
+            'publication_date': get('publicationDate', ''),
+            'submission_date': get('submissionDate', ''),
+            'submission_type': get('submissionType', ''),
 
             # 引用
-            'pubmed_ids': self._extract_pubmed_ids(data.get('references', [])),
-            'dois': self._extract_dois(data.get('references', [])),
+            'pubmed_ids': self._extract_ref_field(references, 'pubmedId'),
+            'dois': self._extract_ref_field(references, 'doi'),
 
             # 链接
             'pride_url': f"https://www.ebi.ac.uk/pride/archive/projects/{pxd_id}",
-        }
+        })
 
-        # 检查是否有SDRF文件
-        metadata['has_sdrf'] = self._check_sdrf_exists(pxd_id)
+        # SDRF存在与否由调用方的下载/批量探测结果传入
+        metadata['has_sdrf'] = has_sdrf
 
         return metadata
 
@@ -152,41 +405,22 @@ class ProteomicsMetadataCollector:
             return '; '.join(str(item.get(field, '')) for item in items if item.get(field))
         return '; '.join(str(item) for item in items if item)
 
-    def _extract_pubmed_ids(self, references: List[Dict]) -> str:
-        """提取PubMed ID"""
-        pubmed_ids = []
-        for ref in references:
-            if ref.get('pubmedId'):
-                pubmed_ids.append(str(ref['pubmedId']))
-        return '; '.join(pubmed_ids)
-
-    def _extract_dois(self, references: List[Dict]) -> str:
-        """提取DOI"""
-        dois = []
-        for ref in references:
-            if ref.get('doi'):
-                dois.append(ref['doi'])
-        return '; '.join(dois)
-
-    def _check_sdrf_exists(self, pxd_id: str) -> bool:
-        """检查SDRF文件是否存在"""
-        # SDRF文件通常命名为 {PXD}.sdrf.tsv
-        sdrf_url = f"https://www.ebi.ac.uk/pride/data/archive/{pxd_id}/{pxd_id}.sdrf.tsv"
-        try:
-            response = self.session.head(sdrf_url, timeout=10)
-            return response.status_code == 200
-        except:
-            return False
+    def _extract_ref_field(self, references: List[Dict], key: str) -> str:
+        """从引用列表中提取指定字段（PubMed ID、DOI等）"""
+        return '; '.join(str(ref[key]) for ref in references if ref.get(key))
 
-    def download_sdrf(self, pxd_id: str) -> Optional[str]:
+    def download_sdrf(self, pxd_id: str) -> tuple:
         """
         下载SDRF文件
 
+        不再预先HEAD探测：直接GET，404即视为没有SDRF，
+        每个数据集省掉一次网络往返。
+
         Args:
             pxd_id: 数据集ID
 
         Returns:
-            SDRF文件路径，如果下载失败返回None
+            (SDRF文件路径或None, 文件是否存在)
         """
         sdrf_url = f"https://www.ebi.ac.uk/pride/data/archive/{pxd_id}/{pxd_id}.sdrf.tsv"
         output_file = SDRF_DIR / f"{pxd_id}.sdrf.tsv"
@@ -194,84 +428,89 @@ class ProteomicsMetadataCollector:
         # 如果文件已存在，跳过
         if output_file.exists():
             print(f"  ↷ SDRF already exists for {pxd_id}")
-            return str(output_file)
+            return str(output_file), True
 
         try:
             print(f"  Downloading SDRF for {pxd_id}...")
-            response = self.session.get(sdrf_url, timeout=60)
-            response.raise_for_status()
-
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(response.text)
+            # 流式分块写入：不经过response.text的整体解码，
+            # 峰值内存只占一个chunk而不是整个文件
+            with self.session.get(sdrf_url, timeout=60, stream=True) as response:
+                if response.status_code == 404:
+                    return None, False
+                response.raise_for_status()
+                with open(output_file, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        f.write(chunk)
 
             print(f"  ✓ SDRF downloaded for {pxd_id}")
-            return str(output_file)
+            return str(output_file), True
 
         except requests.exceptions.RequestException as e:
             print(f"  ✗ Failed to download SDRF for {pxd_id}: {e}")
-            return None
+            output_file.unlink(missing_ok=True)  # 不留下半截文件
+            return None, False
 
-    def collect_pxd_datasets(self, dataset_ids: List[str]) -> pd.DataFrame:
+    def collect_pxd_datasets(self, pxd_datasets: List[str]) -> pd.DataFrame:
         """
         批量收集PXD数据集的元数据
 
         Args:
-            dataset_ids: PXD数据集ID列表
+            pxd_datasets: 已按前缀筛选的PXD数据集ID列表
 
         Returns:
             包含所有元数据的DataFrame
         """
-        pxd_datasets = [did for did in dataset_ids if did.startswith('PXD')]
         print(f"\n{'='*60}")
         print(f"Collecting metadata for {len(pxd_datasets)} PXD datasets")
         print(f"{'='*60}\n")
 
-        all_metadata = []
+        # 优先走aiohttp并发路径：I/O密集，信号量限制并发即可控制请求速率
+        if AIOHTTP_AVAILABLE and pxd_datasets:
+            print(f"Using async collection ({PRIDE_CONCURRENCY} concurrent requests)\n")
+            all_metadata = asyncio.run(self._collect_pxd_async(pxd_datasets))
+            print(f"\n✓ Completed PXD collection: {len(all_metadata)} records\n")
+            return pd.DataFrame(all_metadata)
 
-        for i, pxd_id in enumerate(pxd_datasets, 1):
-            print(f"[{i}/{len(pxd_datasets)}] Processing {pxd_id}")
+        # 回退路径：线程池并发（网络recv期间GIL释放，I/O可重叠），
+        # 共享Session的连接池已按并发数配好，不再需要逐请求sleep
+        print(f"Using thread pool ({PRIDE_CONCURRENCY} workers)\n")
+        with ThreadPoolExecutor(max_workers=PRIDE_CONCURRENCY) as executor:
+            all_metadata = list(executor.map(self._collect_one_sync, pxd_datasets))
 
-            # 获取基础元数据
-            raw_data = self.get_pride_metadata(pxd_id)
+        print(f"\n✓ Completed PXD collection: {len(all_metadata)} records\n")
+        return pd.DataFrame(all_metadata)
 
-            if raw_data:
-                metadata = self.extract_metadata_fields(pxd_id, raw_data)
+    def _collect_one_sync(self, pxd_id: str) -> Dict:
+        """同步抓取单个PXD数据集（线程池worker）"""
+        raw_data = self.get_pride_metadata(pxd_id)
 
-                # 如果有SDRF文件，尝试下载
-                if metadata.get('has_sdrf'):
-                    sdrf_path = self.download_sdrf(pxd_id)
-                    metadata['sdrf_file'] = sdrf_path if sdrf_path else ''
-                else:
-                    metadata['sdrf_file'] = ''
+        if not raw_data:
+            # 记录失败的数据集
+            return {
+                'dataset_id': pxd_id,
+                'repository': 'PRIDE',
+                'error': 'Failed to fetch metadata'
+            }
 
-                all_metadata.append(metadata)
-            else:
-                # 记录失败的数据集
-                all_metadata.append({
-                    'dataset_id': pxd_id,
-                    'repository': 'PRIDE',
-                    'error': 'Failed to fetch metadata'
-                })
+        # 直接尝试下载SDRF，由GET结果推断是否存在
+        sdrf_path, has_sdrf = self.download_sdrf(pxd_id)
 
-            # 速率限制
-            time.sleep(1)
+        metadata = self.extract_metadata_fields(pxd_id, raw_data, has_sdrf=has_sdrf)
+        metadata['sdrf_file'] = sdrf_path if sdrf_path else ''
 
-        print(f"\n✓ Completed PXD collection: {len(all_metadata)} records\n")
-        return pd.DataFrame(all_metadata)
+        return metadata
 
-    def collect_msv_datasets(self, dataset_ids: List[str]) -> pd.DataFrame:
+    def collect_msv_datasets(self, msv_datasets: List[str]) -> pd.DataFrame:
         """
         收集MSV (MassIVE) 数据集的元数据
         使用ppx包（如果可用）或标记为需要手动处理
 
         Args:
-            dataset_ids: 包含MSV数据集的ID列表
+            msv_datasets: 已按前缀筛选的MSV数据集ID列表
 
         Returns:
             包含MSV元数据的DataFrame
         """
-        msv_datasets = [did for did in dataset_ids if did.startswith('MSV')]
-
         if not msv_datasets:
             return pd.DataFrame()
 
@@ -288,12 +527,9 @@ class ProteomicsMetadataCollector:
             use_ppx = False
             print("! ppx package not found, MSV datasets will be marked for manual processing\n")
 
-        all_metadata = []
-
-        for i, msv_id in enumerate(msv_datasets, 1):
-            print(f"[{i}/{len(msv_datasets)}] Processing {msv_id}")
-
-            if use_ppx:
+        if use_ppx:
+            # ppx查询同样是I/O密集，线程池并发抓取
+            def collect_one_msv(msv_id: str) -> Dict:
                 try:
                     proj = ppx.find_project(msv_id)
                     metadata = {
@@ -308,45 +544,43 @@ class ProteomicsMetadataCollector:
                         'pride_url': f"https://massive.ucsd.edu/ProteoSAFe/dataset.jsp?task={msv_id}",
                     }
                     print(f"  ✓ Successfully processed {msv_id}")
+                    return metadata
                 except Exception as e:
                     print(f"  ✗ Error processing {msv_id}: {e}")
-                    metadata = {
+                    return {
                         'dataset_id': msv_id,
                         'repository': 'MassIVE',
                         'error': str(e),
                         'manual_review': True
                     }
-            else:
-                metadata = {
+
+            with ThreadPoolExecutor(max_workers=PRIDE_CONCURRENCY) as executor:
+                all_metadata = list(executor.map(collect_one_msv, msv_datasets))
+        else:
+            all_metadata = []
+            for msv_id in msv_datasets:
+                all_metadata.append({
                     'dataset_id': msv_id,
                     'repository': 'MassIVE',
                     'manual_review': True,
                     'note': 'ppx package not installed - requires manual extraction',
                     'pride_url': f"https://massive.ucsd.edu/ProteoSAFe/dataset.jsp?task={msv_id}",
-                }
+                })
                 print(f"  → {msv_id} marked for manual review")
 
-            all_metadata.append(metadata)
-            time.sleep(1)
-
         print(f"\n✓ Completed MSV collection: {len(all_metadata)} records\n")
         return pd.DataFrame(all_metadata)
 
-    def prepare_manual_datasets(self, dataset_ids: List[str]) -> pd.DataFrame:
+    def prepare_manual_datasets(self, manual_datasets: List[str]) -> pd.DataFrame:
         """
         为JPST和PASS数据集准备手动提取模板
 
         Args:
-            dataset_ids: 数据集ID列表
+            manual_datasets: 已按前缀筛选的JPST/PASS数据集ID列表
 
         Returns:
             包含手动处理信息的DataFrame
         """
-        manual_datasets = [
-            did for did in dataset_ids
-            if did.startswith('JPST') or did.startswith('PASS')
-        ]
-
         if not manual_datasets:
             return pd.DataFrame()
 
@@ -378,18 +612,58 @@ class ProteomicsMetadataCollector:
         print(f"\n✓ Prepared {len(all_metadata)} datasets for manual review\n")
         return pd.DataFrame(all_metadata)
 
-    def save_results(self, df: pd.DataFrame, filename: str):
-        """保存结果到CSV和JSON"""
-        csv_path = DATA_PROCESSED_DIR / f"{filename}.csv"
-        json_path = DATA_PROCESSED_DIR / f"{filename}.json"
+    def save_results(self, df: pd.DataFrame, filename: str,
+                     formats: tuple = ('parquet', 'csv')):
+        """
+        保存结果
 
-        # 保存CSV
-        df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-        print(f"✓ Saved CSV to: {csv_path}")
+        以Parquet（snappy压缩）为主要格式，下游脚本读取速度远快于CSV；
+        CSV保留供人工查看/兼容旧脚本，JSON按需通过formats开启
+        （行式records，不再做慢速的pretty-print）。
+        """
+        if 'parquet' in formats:
+            parquet_path = DATA_PROCESSED_DIR / f"{filename}.parquet"
+            try:
+                df.to_parquet(parquet_path, compression='snappy', index=False)
+                print(f"✓ Saved Parquet to: {parquet_path}")
+            except (ImportError, ValueError) as e:
+                print(f"! Parquet save failed ({e}), keeping CSV only")
+
+        if 'csv' in formats:
+            csv_path = DATA_PROCESSED_DIR / f"{filename}.csv"
+            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            print(f"✓ Saved CSV to: {csv_path}")
+
+        if 'json' in formats:
+            json_path = DATA_PROCESSED_DIR / f"{filename}.json"
+            df.to_json(json_path, orient='records', lines=True, force_ascii=False)
+            print(f"✓ Saved JSON to: {json_path}")
+
+    def write_parquet_combined(self, dfs: List[pd.DataFrame], filename: str) -> bool:
+        """
+        在Arrow侧合并多个子表并写入单个Parquet
 
-        # 保存JSON
-        df.to_json(json_path, orient='records', indent=2, force_ascii=False)
-        print(f"✓ Saved JSON to: {json_path}")
+        各仓库的子表列集合不同，pa.concat_tables的permissive提升会
+        自动对齐schema并以null补缺列，不需要先在pandas里concat出
+        一份两倍体量的中间拷贝。
+
+        Returns:
+            是否成功写出（pyarrow不可用或schema无法统一时返回False）
+        """
+        if not PYARROW_AVAILABLE:
+            return False
+
+        parquet_path = DATA_PROCESSED_DIR / f"{filename}.parquet"
+        try:
+            tables = [pa.Table.from_pandas(df, preserve_index=False) for df in dfs]
+            combined = pa.concat_tables(
+                tables, promote_options='permissive').combine_chunks()
+            pq.write_table(combined, parquet_path, compression='snappy')
+            print(f"✓ Saved Parquet to: {parquet_path}")
+            return True
+        except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            print(f"! Arrow-side combine failed ({e}), falling back to pandas concat")
+            return False
 
 
 def main():
@@ -411,37 +685,47 @@ def main():
     dataset_ids = collector.read_dataset_list(metadata_list_file)
     print(f"✓ Found {len(dataset_ids)} datasets\n")
 
-    # 统计数据集分布
-    pxd_count = sum(1 for d in dataset_ids if d.startswith('PXD'))
-    msv_count = sum(1 for d in dataset_ids if d.startswith('MSV'))
-    jpst_count = sum(1 for d in dataset_ids if d.startswith('JPST'))
-    pass_count = sum(1 for d in dataset_ids if d.startswith('PASS'))
+    # 单次遍历按前缀分桶，避免统计和各收集器重复扫描同一个列表
+    buckets = {prefix: [] for prefix in REPO_PREFIXES}
+    for did in dataset_ids:
+        repo = PREFIX_MAP.get(did[:3])
+        if repo:
+            buckets[repo].append(did)
 
     print("Dataset distribution:")
-    print(f"  PXD (ProteomeXchange): {pxd_count}")
-    print(f"  MSV (MassIVE): {msv_count}")
-    print(f"  JPST (jPOST): {jpst_count}")
-    print(f"  PASS (PeptideAtlas): {pass_count}")
+    print(f"  PXD (ProteomeXchange): {len(buckets['PXD'])}")
+    print(f"  MSV (MassIVE): {len(buckets['MSV'])}")
+    print(f"  JPST (jPOST): {len(buckets['JPST'])}")
+    print(f"  PASS (PeptideAtlas): {len(buckets['PASS'])}")
+
+    # --debug时额外落盘各仓库的中间结果（默认只写合并后的总表，减少重复I/O）
+    debug = '--debug' in sys.argv
 
     # 收集PXD数据集
-    pxd_df = collector.collect_pxd_datasets(dataset_ids)
-    collector.save_results(pxd_df, "pxd_metadata")
+    pxd_df = collector.collect_pxd_datasets(buckets['PXD'])
+    if debug:
+        collector.save_results(pxd_df, "pxd_metadata")
 
     # 收集MSV数据集
-    msv_df = collector.collect_msv_datasets(dataset_ids)
-    if not msv_df.empty:
+    msv_df = collector.collect_msv_datasets(buckets['MSV'])
+    if debug and not msv_df.empty:
         collector.save_results(msv_df, "msv_metadata")
 
     # 准备手动提取数据集
-    manual_df = collector.prepare_manual_datasets(dataset_ids)
-    if not manual_df.empty:
+    manual_df = collector.prepare_manual_datasets(buckets['JPST'] + buckets['PASS'])
+    if debug and not manual_df.empty:
         collector.save_results(manual_df, "manual_datasets")
 
     # 合并所有结果
     all_dfs = [df for df in [pxd_df, msv_df, manual_df] if not df.empty]
     if all_dfs:
-        combined_df = pd.concat(all_dfs, ignore_index=True)
-        collector.save_results(combined_df, "all_metadata_raw")
+        # Parquet在Arrow侧直接合并写出；concat会留下碎片化的内部块，
+        # CSV写出前先copy()整理一次，让序列化在连续内存上进行
+        wrote_parquet = collector.write_parquet_combined(all_dfs, "all_metadata_raw")
+        combined_df = pd.concat(all_dfs, ignore_index=True).copy()
+        collector.save_results(
+            combined_df, "all_metadata_raw",
+            formats=('csv',) if wrote_parquet else ('parquet', 'csv'))
 
         print("\n" + "="*60)
         print("Collection Summary")
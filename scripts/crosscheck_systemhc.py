@@ -5,8 +5,11 @@
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import json
+from collections import Counter
 from pathlib import Path
 from typing import Dict, List, Optional
 import time
@@ -16,6 +19,9 @@ PROJECT_ROOT = Path(__file__).parent.parent
 DATA_PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 DATA_VALIDATION_DIR = PROJECT_ROOT / "data" / "validation"
 
+# 四类数据集ID合并为一个交替正则，整个HTML只扫描一遍
+_ID_RE = re.compile(r'\b(PXD\d{6}|MSV\d{9}|JPST\d{6}|PASS\d{5})\b')
+
 
 class SysteMHCCrossChecker:
     """SysteMHC交叉验证器"""
@@ -27,6 +33,16 @@ class SysteMHCCrossChecker:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
 
+        # 连接池 + urllib3重试（指数退避），避免每次请求重新握手
+        adapter = HTTPAdapter(
+            pool_connections=32, pool_maxsize=64,
+            max_retries=Retry(
+                total=3, backoff_factor=1,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET', 'HEAD']))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
     def fetch_systemhc_datasets_page(self) -> Optional[str]:
         """获取SysteMHC的datasets页面"""
         try:
@@ -39,30 +55,18 @@ class SysteMHCCrossChecker:
             print(f"Error fetching SysteMHC datasets: {e}")
             return None
 
-    def parse_dataset_ids_from_html(self, html: str) -> List[Dict]:
-        """从HTML中解析数据集ID"""
-        datasets = []
-
-        # 查找PXD, MSV, JPST, PASS等ID
-        pxd_pattern = r'(PXD\d{6})'
-        msv_pattern = r'(MSV\d{9})'
-        jpst_pattern = r'(JPST\d{6})'
-        pass_pattern = r'(PASS\d{5})'
-
-        # 提取所有匹配
-        pxd_ids = re.findall(pxd_pattern, html)
-        msv_ids = re.findall(msv_pattern, html)
-        jpst_ids = re.findall(jpst_pattern, html)
-        pass_ids = re.findall(pass_pattern, html)
+    def parse_dataset_ids_from_html(self, html: str) -> List[str]:
+        """从HTML中解析数据集ID（单个交替正则一次扫描）"""
+        all_ids = set(_ID_RE.findall(html))
 
-        # 合并并去重
-        all_ids = set(pxd_ids + msv_ids + jpst_ids + pass_ids)
+        # 按前3个字符统计各仓库的数量（PXD/MSV/JPS/PAS互不重复）
+        counts = Counter(dataset_id[:3] for dataset_id in all_ids)
 
         print(f"\nFound dataset IDs in SysteMHC:")
-        print(f"  PXD: {len(set(pxd_ids))}")
-        print(f"  MSV: {len(set(msv_ids))}")
-        print(f"  JPST: {len(set(jpst_ids))}")
-        print(f"  PASS: {len(set(pass_ids))}")
+        print(f"  PXD: {counts.get('PXD', 0)}")
+        print(f"  MSV: {counts.get('MSV', 0)}")
+        print(f"  JPST: {counts.get('JPS', 0)}")
+        print(f"  PASS: {counts.get('PAS', 0)}")
         print(f"  Total unique: {len(all_ids)}")
 
         return list(all_ids)
@@ -83,16 +87,10 @@ class SysteMHCCrossChecker:
         print("Cross-checking with SysteMHC")
         print("="*70 + "\n")
 
-        # 创建新列
-        our_df['in_systemhc'] = False
-        our_df['systemhc_verified'] = False
-
-        # 检查每个数据集是否在SysteMHC中
-        for idx, row in our_df.iterrows():
-            dataset_id = row['dataset_id']
-            if dataset_id in systemhc_ids:
-                our_df.at[idx, 'in_systemhc'] = True
-                our_df.at[idx, 'systemhc_verified'] = True
+        # 向量化集合查表代替逐行iterrows+at写入
+        systemhc_set = set(systemhc_ids)
+        our_df['in_systemhc'] = our_df['dataset_id'].isin(systemhc_set)
+        our_df['systemhc_verified'] = our_df['in_systemhc']
 
         # 统计
         in_systemhc = our_df['in_systemhc'].sum()
@@ -107,13 +105,17 @@ class SysteMHCCrossChecker:
 
     def analyze_missing_datasets(self, df: pd.DataFrame) -> Dict:
         """分析不在SysteMHC中的数据集"""
-        not_in_systemhc = df[df['in_systemhc'] == False]
+        # 掩码筛选一次、只取用到的三列，避免== False比较和整表复制
+        missing = df.loc[~df['in_systemhc'], ['repository', 'hla_type', 'disease_type']]
 
+        # category列的value_counts会带上计数为0的类别，序列化前去掉
         analysis = {
-            'total_missing': len(not_in_systemhc),
-            'by_repository': not_in_systemhc['repository'].value_counts().to_dict(),
-            'by_hla_type': not_in_systemhc['hla_type'].value_counts().to_dict(),
-            'unknown_diseases': len(not_in_systemhc[not_in_systemhc['disease_type'] == 'Unknown']),
+            'total_missing': len(missing),
+            'by_repository': missing['repository'].value_counts()
+                             .loc[lambda s: s.gt(0)].to_dict(),
+            'by_hla_type': missing['hla_type'].value_counts()
+                           .loc[lambda s: s.gt(0)].to_dict(),
+            'unknown_diseases': int(missing['disease_type'].eq('Unknown').sum()),
         }
 
         print("\n" + "="*70)
@@ -139,88 +141,92 @@ class SysteMHCCrossChecker:
         优先级：Unknown疾病类型 + 在SysteMHC中
         """
         # 选择：在SysteMHC中但疾病类型为Unknown的数据集
-        candidates = df[
-            (df['in_systemhc'] == True) &
-            (df['disease_type'] == 'Unknown')
-        ]
+        candidates = df.loc[df['in_systemhc'] & df['disease_type'].eq('Unknown')]
 
-        suggestions = []
         print("\n" + "="*70)
         print("Datasets in SysteMHC that could benefit from manual lookup")
         print("="*70 + "\n")
 
         print(f"Found {len(candidates)} datasets with Unknown disease in SysteMHC\n")
 
-        for idx, row in candidates.head(20).iterrows():
-            suggestions.append(row['dataset_id'])
-            print(f"  {row['dataset_id']} - HLA: {row['hla_type']}")
+        head = candidates.head(20)
+        suggestions = head['dataset_id'].tolist()
+        for dataset_id, hla_type in zip(suggestions, head['hla_type'].tolist()):
+            print(f"  {dataset_id} - HLA: {hla_type}")
             print(f"    URL: https://systemhc.sjtu.edu.cn/datasets")
-            print(f"    Search for: {row['dataset_id']}")
+            print(f"    Search for: {dataset_id}")
             print()
 
         return suggestions
 
     def generate_cross_check_report(self, df: pd.DataFrame, analysis: Dict):
-        """生成交叉验证报告"""
+        """生成交叉验证报告（在内存中拼好后一次性写入）"""
         report_file = DATA_VALIDATION_DIR / "systemhc_crosscheck_report.txt"
 
-        with open(report_file, 'w', encoding='utf-8') as f:
-            f.write("="*70 + "\n")
-            f.write("SysteMHC交叉验证报告\n")
-            f.write("="*70 + "\n\n")
-
-            f.write("一、数据集重叠分析\n")
-            f.write("-"*70 + "\n")
-            in_systemhc = df['in_systemhc'].sum()
-            f.write(f"我们的数据集总数: {len(df)}\n")
-            f.write(f"在SysteMHC中的数据集: {in_systemhc} ({in_systemhc/len(df)*100:.1f}%)\n")
-            f.write(f"不在SysteMHC中: {len(df)-in_systemhc}\n\n")
-
-            f.write("二、不在SysteMHC中的数据集分布\n")
-            f.write("-"*70 + "\n")
-            f.write(f"总数: {analysis['total_missing']}\n\n")
-
-            f.write("按数据库分布:\n")
-            for repo, count in analysis['by_repository'].items():
-                f.write(f"  {repo}: {count}\n")
-
-            f.write("\n按HLA类型分布:\n")
-            for hla, count in analysis['by_hla_type'].items():
-                f.write(f"  {hla}: {count}\n")
-
-            f.write("\n三、在SysteMHC中但疾病类型为Unknown的数据集\n")
-            f.write("-"*70 + "\n")
-
-            unknown_in_systemhc = df[
-                (df['in_systemhc'] == True) &
-                (df['disease_type'] == 'Unknown')
-            ]
-
-            f.write(f"数量: {len(unknown_in_systemhc)}\n\n")
-            f.write("建议手动查找的数据集:\n")
-
-            for idx, row in unknown_in_systemhc.iterrows():
-                f.write(f"\n{row['dataset_id']}\n")
-                f.write(f"  HLA类型: {row['hla_type']}\n")
-                f.write(f"  样本类型: {row['sample_type']}\n")
-                f.write(f"  标题: {str(row['title'])[:60]}...\n")
-                f.write(f"  SysteMHC链接: https://systemhc.sjtu.edu.cn/datasets\n")
-
-            f.write("\n四、使用SysteMHC补充数据的建议\n")
-            f.write("-"*70 + "\n")
-            f.write("1. 访问 https://systemhc.sjtu.edu.cn/datasets\n")
-            f.write("2. 搜索上述数据集ID\n")
-            f.write("3. 查看详细的HLA等位基因信息\n")
-            f.write("4. 查看疾病类型和样本信息\n")
-            f.write("5. 更新我们的元数据表格\n\n")
-
-            f.write("五、SysteMHC的优势\n")
-            f.write("-"*70 + "\n")
-            f.write("• 专注于HLA/MHC免疫肽组学\n")
-            f.write("• 包含详细的HLA等位基因信息\n")
-            f.write("• 提供样本统计和图表\n")
-            f.write("• 可下载光谱库\n")
-            f.write("• 与PRIDE、MassIVE等数据库关联\n\n")
+        in_systemhc = df['in_systemhc'].sum()
+        parts = [
+            "="*70 + "\n",
+            "SysteMHC交叉验证报告\n",
+            "="*70 + "\n\n",
+
+            "一、数据集重叠分析\n",
+            "-"*70 + "\n",
+            f"我们的数据集总数: {len(df)}\n",
+            f"在SysteMHC中的数据集: {in_systemhc} ({in_systemhc/len(df)*100:.1f}%)\n",
+            f"不在SysteMHC中: {len(df)-in_systemhc}\n\n",
+
+            "二、不在SysteMHC中的数据集分布\n",
+            "-"*70 + "\n",
+            f"总数: {analysis['total_missing']}\n\n",
+
+            "按数据库分布:\n",
+        ]
+        parts.extend(f"  {repo}: {count}\n"
+                     for repo, count in analysis['by_repository'].items())
+
+        parts.append("\n按HLA类型分布:\n")
+        parts.extend(f"  {hla}: {count}\n"
+                     for hla, count in analysis['by_hla_type'].items())
+
+        parts.append("\n三、在SysteMHC中但疾病类型为Unknown的数据集\n")
+        parts.append("-"*70 + "\n")
+
+        unknown_in_systemhc = df.loc[
+            df['in_systemhc'] & df['disease_type'].eq('Unknown'),
+            ['dataset_id', 'hla_type', 'sample_type', 'title']
+        ]
+
+        parts.append(f"数量: {len(unknown_in_systemhc)}\n\n")
+        parts.append("建议手动查找的数据集:\n")
+
+        for dataset_id, hla_type, sample_type, title in unknown_in_systemhc.itertuples(
+                index=False, name=None):
+            parts.append(
+                f"\n{dataset_id}\n"
+                f"  HLA类型: {hla_type}\n"
+                f"  样本类型: {sample_type}\n"
+                f"  标题: {str(title)[:60]}...\n"
+                f"  SysteMHC链接: https://systemhc.sjtu.edu.cn/datasets\n")
+
+        parts.append(
+            "\n四、使用SysteMHC补充数据的建议\n"
+            + "-"*70 + "\n"
+            "1. 访问 https://systemhc.sjtu.edu.cn/datasets\n"
+            "2. 搜索上述数据集ID\n"
+            "3. 查看详细的HLA等位基因信息\n"
+            "4. 查看疾病类型和样本信息\n"
+            "5. 更新我们的元数据表格\n\n"
+
+            "五、SysteMHC的优势\n"
+            + "-"*70 + "\n"
+            "• 专注于HLA/MHC免疫肽组学\n"
+            "• 包含详细的HLA等位基因信息\n"
+            "• 提供样本统计和图表\n"
+            "• 可下载光谱库\n"
+            "• 与PRIDE、MassIVE等数据库关联\n\n")
+
+        with open(report_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            f.write(''.join(parts))
 
         print(f"\n✓ Cross-check report saved to: {report_file}")
 
@@ -247,7 +253,15 @@ def main():
         return
 
     print(f"Loading our data from: {input_file}")
-    our_df = pd.read_csv(input_file)
+    # 高基数重复字符串列按category读入：后续的value_counts/比较
+    # 在整型编码上进行，而不是逐行哈希字符串
+    our_df = pd.read_csv(input_file, dtype={
+        'repository': 'category',
+        'hla_type': 'category',
+        'sample_type': 'category',
+        'disease_type': 'category',
+        'disease_category': 'category',
+    })
     print(f"✓ Loaded {len(our_df)} datasets\n")
 
     # 初始化交叉验证器
@@ -5,10 +5,67 @@
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
+import io
 import re
 import time
 import json
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+# 可选：pyahocorasick一次线性扫描同时匹配所有疾病关键词
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# 可选：aiohttp并发抓取数据集页面（不可用时回退到顺序请求）
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# 可选：pyarrow的多线程C++ CSV解析器读写表格（不可用时回退pandas）
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 可选：orjson解析JSON-LD比stdlib json快数倍（不可用时回退）
+try:
+    import orjson
+    _loads = orjson.loads
+    ORJSON_AVAILABLE = True
+except ImportError:
+    _loads = json.loads
+    ORJSON_AVAILABLE = False
+
+# 可选：requests-cache把抓取过的页面落盘到SQLite，
+# 调试补充规则反复重跑时不再重新下载每个页面
+try:
+    import requests_cache
+    REQUESTS_CACHE_AVAILABLE = True
+except ImportError:
+    REQUESTS_CACHE_AVAILABLE = False
+
+# 可选：aiolimiter令牌桶限速，固定延迟改为总速率预算
+try:
+    from aiolimiter import AsyncLimiter
+    AIOLIMITER_AVAILABLE = True
+except ImportError:
+    AIOLIMITER_AVAILABLE = False
+
+# 并发请求上限（兼作对SysteMHC的礼貌性限流）
+SYSTEMHC_CONCURRENCY = 8
+# 令牌桶预算：对SysteMHC的总请求速率（次/秒）
+SYSTEMHC_RATE = 3
 from pathlib import Path
 from typing import Dict, Optional, List
 from urllib.parse import quote
@@ -18,15 +75,106 @@ PROJECT_ROOT = Path(__file__).parent.parent
 DATA_PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 DATA_VALIDATION_DIR = PROJECT_ROOT / "data" / "validation"
 
+# 预编译正则：等位基因提取用单个合并模式
+_HLA_RE = re.compile(r'HLA-[A-Z]+\*\d+:\d+')
+
+# HLA分类的基因名标记（表格单元格可能含多个等位基因，按子串匹配）
+_CLASS_I_MARKS = ('HLA-A', 'HLA-B', 'HLA-C')
+_CLASS_II_MARKS = ('HLA-DR', 'HLA-DQ', 'HLA-DP', 'HLA-DM')
+
+
+def _classify_hla_classes(alleles):
+    """判断等位基因列表覆盖的HLA类别，命中两类后立即短路
+
+    C级子串查找代替逐个等位基因的正则search
+    """
+    has_class_i = has_class_ii = False
+    for allele in alleles:
+        if not has_class_i and any(m in allele for m in _CLASS_I_MARKS):
+            has_class_i = True
+        if not has_class_ii and any(m in allele for m in _CLASS_II_MARKS):
+            has_class_ii = True
+        if has_class_i and has_class_ii:
+            break
+    return has_class_i, has_class_ii
+
+# 可选：lxml（libxml2，C实现）解析HTML比纯Python的html.parser快约一个量级
+try:
+    import lxml  # noqa: F401
+    BS4_PARSER = 'lxml'
+except ImportError:
+    BS4_PARSER = 'html.parser'
+
+# 压缩协商：装了brotli解码器才声明br，否则urllib3无法解压响应
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# 可选：selectolax（Lexbor绑定）解析比lxml再快数倍，不可用时回退bs4
+try:
+    from selectolax.parser import HTMLParser
+    SELECTOLAX_AVAILABLE = True
+except ImportError:
+    SELECTOLAX_AVAILABLE = False
+
 class SysteMHCEnricher:
     """SysteMHC数据补充器"""
 
+    # 疾病关键词（页面描述文本中匹配）
+    DISEASE_KEYWORDS = [
+        'melanoma', 'cancer', 'leukemia', 'lymphoma', 'carcinoma',
+        'COVID-19', 'influenza', 'tuberculosis', 'HIV',
+        'diabetes', 'alzheimer', 'parkinson', 'multiple sclerosis'
+    ]
+
+    # 短大写缩写词只做整词匹配：子串匹配会让hiv命中"archived"等普通单词
+    _ACRONYM_RE = re.compile(r'^[A-Z]{2,5}$')
+
     def __init__(self):
         self.base_url = "https://systemhc.sjtu.edu.cn"
-        self.session = requests.Session()
+        # 页面缓存7天：命中的GET直接从磁盘返回，不走网络
+        if REQUESTS_CACHE_AVAILABLE:
+            self.session = requests_cache.CachedSession(
+                str(DATA_PROCESSED_DIR / "systemhc_http_cache"),
+                expire_after=7 * 24 * 3600,
+                allowable_methods=('GET',))
+        else:
+            self.session = requests.Session()
         self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Connection': 'keep-alive',
+            'Accept-Encoding': ACCEPT_ENCODING,
         })
+
+        # 连接池 + keep-alive：同一主机的后续请求免去TLS握手，
+        # 重试（指数退避）由urllib3处理
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=20,
+            max_retries=Retry(
+                total=3, backoff_factor=0.5,
+                status_forcelist=[502, 503, 504]))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # 缩写词不进自动机/子串匹配，改用带\b边界的正则补扫
+        acronyms = [k for k in self.DISEASE_KEYWORDS
+                    if self._ACRONYM_RE.match(k)]
+        self._disease_acronym_re = re.compile(
+            '|'.join(r'\b' + re.escape(k) + r'\b' for k in acronyms),
+            re.IGNORECASE) if acronyms else None
+
+        # Aho-Corasick自动机：一次遍历文本即可命中全部关键词
+        self._disease_ac = None
+        if AHOCORASICK_AVAILABLE:
+            self._disease_ac = ahocorasick.Automaton()
+            for keyword in self.DISEASE_KEYWORDS:
+                if self._ACRONYM_RE.match(keyword):
+                    continue
+                self._disease_ac.add_word(keyword.lower(), keyword.lower())
+            self._disease_ac.make_automaton()
+
         self.systemhc_data = {}
 
     def try_simple_fetch(self, dataset_id: str) -> Optional[Dict]:
@@ -39,11 +187,9 @@ class SysteMHCEnricher:
             response = self.session.get(url, timeout=30)
             response.raise_for_status()
 
-            # 解析HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # 尝试从页面中提取信息
-            data = self._parse_dataset_page(soup, dataset_id)
+            # 解析HTML：传原始字节而不是解码后的str，
+            # 编码探测和DOM构建都在C层完成
+            data = self._parse_dataset_page(response.content, dataset_id)
 
             if data and any(data.values()):
                 return data
@@ -55,11 +201,28 @@ class SysteMHCEnricher:
             print(f"    ✗ Error: {e}")
             return None
 
-    def _parse_dataset_page(self, soup: BeautifulSoup, dataset_id: str) -> Dict:
+    def _parse_dataset_page(self, html: bytes, dataset_id: str) -> Dict:
+        """
+        从页面HTML中解析数据集信息
+        selectolax可用时走Lexbor快路径，否则用BeautifulSoup
+        """
+        if SELECTOLAX_AVAILABLE:
+            return self._parse_dataset_page_lx(html, dataset_id)
+        return self._parse_dataset_page_bs4(
+            BeautifulSoup(html, BS4_PARSER), dataset_id)
+
+    def _parse_dataset_page_lx(self, html: bytes, dataset_id: str) -> Dict:
         """
-        从BeautifulSoup对象中解析数据集信息
-        尝试多种方式提取数据
+        selectolax版页面解析：CSS选择器代替find_all，
+        文本提取全部在C层完成
         """
+        tree = HTMLParser(html)
+
+        organisms = {}
+        tissues = {}
+        cell_types = {}
+        hla_alleles = {}
+
         data = {
             'dataset_id': dataset_id,
             'hla_alleles': [],
@@ -70,49 +233,129 @@ class SysteMHCEnricher:
         }
 
         # 方法1: 查找表格数据
-        tables = soup.find_all('table')
+        for table in tree.css('table'):
+            rows = table.css('tr')
+            for row in rows[1:]:  # 跳过表头
+                cells = row.css('td')
+                if len(cells) >= 5:
+                    # 假设列顺序: SampleID, NumReplicates, Organism, TissueType, CellType, MHCAllele
+                    organism = cells[2].text(strip=True)
+                    if organism:
+                        organisms[organism] = None
+
+                    tissue = cells[3].text(strip=True)
+                    if tissue:
+                        tissues[tissue] = None
+
+                    cell_type = cells[4].text(strip=True)
+                    if cell_type:
+                        cell_types[cell_type] = None
+
+                    if len(cells) > 5:
+                        mhc_allele = cells[5].text(strip=True)
+                        if mhc_allele:
+                            hla_alleles[mhc_allele] = None
+
+        # 方法2: 查找页面中的关键词
+        page_text = tree.text()
+
+        # 提取HLA等位基因（单个合并模式只扫描一遍页面文本）
+        hla_alleles.update(dict.fromkeys(_HLA_RE.findall(page_text)))
+
+        data['organisms'] = list(organisms)
+        data['tissues'] = list(tissues)
+        data['cell_types'] = list(cell_types)
+        data['hla_alleles'] = list(hla_alleles)
+
+        # 方法3: 查找meta标签或JSON-LD数据
+        for meta in tree.css('meta[name="description"]'):
+            desc = meta.attributes.get('content') or ''
+            self._extract_diseases_from_text(desc, data['diseases'])
+
+        # 查找JSON-LD数据
+        for script in tree.css('script[type="application/ld+json"]'):
+            try:
+                json_data = _loads(script.text())
+                if isinstance(json_data, dict):
+                    if 'disease' in json_data:
+                        disease = json_data['disease']
+                        if disease not in data['diseases']:
+                            data['diseases'].append(disease)
+            except Exception:
+                pass
+
+        return data
+
+    def _parse_dataset_page_bs4(self, soup: BeautifulSoup, dataset_id: str) -> Dict:
+        """
+        从BeautifulSoup对象中解析数据集信息（selectolax不可用时的回退）
+        """
+        # dict当有序集合用：成员判断O(1)，同时保留首次出现顺序，
+        # 替代每次append前的线性 not in 扫描
+        organisms = {}
+        tissues = {}
+        cell_types = {}
+        hla_alleles = {}
+
+        data = {
+            'dataset_id': dataset_id,
+            'hla_alleles': [],
+            'tissues': [],
+            'diseases': [],
+            'cell_types': [],
+            'organisms': []
+        }
+
+        # 一次遍历DOM同时收集table/meta/JSON-LD节点，
+        # 代替三次独立的find_all全树扫描
+        tables = []
+        meta_tags = []
+        json_ld_scripts = []
+        for element in soup.descendants:
+            name = getattr(element, 'name', None)
+            if name == 'table':
+                tables.append(element)
+            elif name == 'meta':
+                meta_tags.append(element)
+            elif name == 'script' and element.get('type') == 'application/ld+json':
+                json_ld_scripts.append(element)
+
+        # 方法1: 查找表格数据
         for table in tables:
             rows = table.find_all('tr')
             for row in rows[1:]:  # 跳过表头
                 cells = row.find_all('td')
                 if len(cells) >= 5:
                     # 假设列顺序: SampleID, NumReplicates, Organism, TissueType, CellType, MHCAllele
-                    if len(cells) > 2:
-                        organism = cells[2].get_text(strip=True)
-                        if organism and organism not in data['organisms']:
-                            data['organisms'].append(organism)
+                    organism = cells[2].get_text(strip=True)
+                    if organism:
+                        organisms[organism] = None
 
-                    if len(cells) > 3:
-                        tissue = cells[3].get_text(strip=True)
-                        if tissue and tissue not in data['tissues']:
-                            data['tissues'].append(tissue)
+                    tissue = cells[3].get_text(strip=True)
+                    if tissue:
+                        tissues[tissue] = None
 
-                    if len(cells) > 4:
-                        cell_type = cells[4].get_text(strip=True)
-                        if cell_type and cell_type not in data['cell_types']:
-                            data['cell_types'].append(cell_type)
+                    cell_type = cells[4].get_text(strip=True)
+                    if cell_type:
+                        cell_types[cell_type] = None
 
                     if len(cells) > 5:
                         mhc_allele = cells[5].get_text(strip=True)
-                        if mhc_allele and mhc_allele not in data['hla_alleles']:
-                            data['hla_alleles'].append(mhc_allele)
+                        if mhc_allele:
+                            hla_alleles[mhc_allele] = None
 
         # 方法2: 查找页面中的关键词
         page_text = soup.get_text()
 
-        # 提取HLA等位基因
-        hla_patterns = [
-            r'HLA-[A-Z]\*\d+:\d+',
-            r'HLA-[A-Z][A-Z]+\*\d+:\d+',
-        ]
-        for pattern in hla_patterns:
-            matches = re.findall(pattern, page_text)
-            for match in matches:
-                if match not in data['hla_alleles']:
-                    data['hla_alleles'].append(match)
+        # 提取HLA等位基因（单个合并模式只扫描一遍页面文本）
+        hla_alleles.update(dict.fromkeys(_HLA_RE.findall(page_text)))
+
+        data['organisms'] = list(organisms)
+        data['tissues'] = list(tissues)
+        data['cell_types'] = list(cell_types)
+        data['hla_alleles'] = list(hla_alleles)
 
         # 方法3: 查找meta标签或JSON-LD数据
-        meta_tags = soup.find_all('meta')
         for meta in meta_tags:
             if meta.get('name') == 'description':
                 desc = meta.get('content', '')
@@ -120,10 +363,10 @@ class SysteMHCEnricher:
                 self._extract_diseases_from_text(desc, data['diseases'])
 
         # 查找JSON-LD数据
-        json_ld_scripts = soup.find_all('script', type='application/ld+json')
         for script in json_ld_scripts:
             try:
-                json_data = json.loads(script.string)
+                # NavigableString是str子类但orjson只认准确类型，先转bytes
+                json_data = _loads(script.string.encode())
                 # 尝试从JSON中提取相关信息
                 if isinstance(json_data, dict):
                     if 'disease' in json_data:
@@ -137,14 +380,25 @@ class SysteMHCEnricher:
 
     def _extract_diseases_from_text(self, text: str, diseases_list: List):
         """从文本中提取疾病关键词"""
-        disease_keywords = [
-            'melanoma', 'cancer', 'leukemia', 'lymphoma', 'carcinoma',
-            'COVID-19', 'influenza', 'tuberculosis', 'HIV',
-            'diabetes', 'alzheimer', 'parkinson', 'multiple sclerosis'
-        ]
         text_lower = text.lower()
-        for keyword in disease_keywords:
-            if keyword in text_lower and keyword not in [d.lower() for d in diseases_list]:
+
+        if self._disease_ac is not None:
+            # 一次O(N)扫描同时命中所有关键词
+            found = {keyword for _, keyword in self._disease_ac.iter(text_lower)}
+        else:
+            found = {keyword.lower() for keyword in self.DISEASE_KEYWORDS
+                     if not self._ACRONYM_RE.match(keyword)
+                     and keyword.lower() in text_lower}
+
+        # 缩写词统一走整词边界正则，两条路径共用
+        if self._disease_acronym_re is not None:
+            found.update(m.lower() for m
+                         in self._disease_acronym_re.findall(text_lower))
+
+        existing = {d.lower() for d in diseases_list}
+        for keyword in self.DISEASE_KEYWORDS:
+            key = keyword.lower()
+            if key in found and key not in existing:
                 diseases_list.append(keyword.title())
 
     def fetch_dataset_info(self, dataset_id: str) -> Optional[Dict]:
@@ -167,10 +421,106 @@ class SysteMHCEnricher:
 
         return data
 
+    def _cache_store_page(self, url: str, body: bytes):
+        """把异步抓取的响应体写回requests-cache磁盘缓存
+
+        aiohttp路径绕过了CachedSession，不手动回写的话
+        重跑时并发批次仍会重新下载所有页面
+        """
+        if not REQUESTS_CACHE_AVAILABLE:
+            return
+        try:
+            response = requests.Response()
+            response.status_code = 200
+            response.url = url
+            response._content = body
+            response.request = requests.Request(
+                'GET', url, headers=dict(self.session.headers)).prepare()
+            # requests-cache序列化时要读raw响应
+            response.raw = HTTPResponse(
+                body=io.BytesIO(body), status=200, preload_content=False)
+            response.raw._request_url = url
+            self.session.cache.save_response(
+                response,
+                expires=datetime.now(timezone.utc) + timedelta(seconds=7 * 24 * 3600))
+        except Exception:
+            pass
+
+    async def _fetch_one(self, sem, session, dataset_id: str, limiter=None):
+        """异步抓取并解析单个数据集页面（信号量限制并发）"""
+        url = f"{self.base_url}/dataset/?dataset_id={dataset_id}"
+        async with sem:
+            try:
+                if limiter is not None:
+                    # 令牌桶限速：拿到令牌立即发请求，无固定延迟
+                    await limiter.acquire()
+                print(f"  Fetching: {url}")
+                async with session.get(
+                        url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                    response.raise_for_status()
+                    body = await response.read()
+                if limiter is None:
+                    # 无限速器时退回信号量内的固定小延迟
+                    await asyncio.sleep(0.2)
+            except Exception as e:
+                print(f"    ✗ Error: {e}")
+                return dataset_id, None
+
+        # 新抓取的页面写入磁盘缓存，重跑时从缓存直接返回
+        self._cache_store_page(url, body)
+
+        # 解析仍走同步路径（CPU部分）
+        data = self._parse_dataset_page(body, dataset_id)
+
+        if data and any(data.values()):
+            return dataset_id, data
+        print(f"    ⚠ Page loaded but no data extracted (JavaScript-rendered)")
+        return dataset_id, None
+
+    async def _batch_async(self, dataset_ids: List[str]) -> Dict[str, Dict]:
+        """并发抓取所有候选数据集"""
+        sem = asyncio.Semaphore(SYSTEMHC_CONCURRENCY)
+        limiter = AsyncLimiter(SYSTEMHC_RATE, 1) if AIOLIMITER_AVAILABLE else None
+        connector = aiohttp.TCPConnector(
+            limit=SYSTEMHC_CONCURRENCY, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(
+                connector=connector,
+                headers=dict(self.session.headers)) as session:
+            results = await asyncio.gather(
+                *(self._fetch_one(sem, session, did, limiter)
+                  for did in dataset_ids))
+        return {did: data for did, data in results if data}
+
     def batch_fetch_datasets(self, dataset_ids: List[str]) -> Dict[str, Dict]:
         """
         批量获取数据集信息
         """
+        # 优先aiohttp并发路径：N个RTT折叠成约N/并发数
+        if AIOHTTP_AVAILABLE and dataset_ids:
+            results = {}
+            pending = dataset_ids
+
+            # 已缓存的页面走CachedSession同步返回（磁盘读，无网络），
+            # 只有缓存未命中的数据集才进并发批次
+            if REQUESTS_CACHE_AVAILABLE:
+                pending = []
+                for dataset_id in dataset_ids:
+                    url = f"{self.base_url}/dataset/?dataset_id={dataset_id}"
+                    if self.session.cache.contains(url=url):
+                        data = self.fetch_dataset_info(dataset_id)
+                        if data:
+                            results[dataset_id] = data
+                    else:
+                        pending.append(dataset_id)
+                cached_count = len(dataset_ids) - len(pending)
+                if cached_count:
+                    print(f"  ✓ {cached_count} pages served from cache")
+
+            if pending:
+                print(f"Using async fetching ({SYSTEMHC_CONCURRENCY} concurrent requests)")
+                results.update(asyncio.run(self._batch_async(pending)))
+            return results
+
         results = {}
         total = len(dataset_ids)
 
@@ -181,94 +531,134 @@ class SysteMHCEnricher:
             if data:
                 results[dataset_id] = data
 
-            # 礼貌性延迟
+            # 礼貌性延迟：keep-alive复用连接后无需长间隔
             if i < total:
-                time.sleep(2)
+                time.sleep(0.3)
 
         return results
 
+    @staticmethod
+    def _assign_with_categories(df: pd.DataFrame, col: str,
+                                idx: pd.Index, values: pd.Series):
+        """按标签写入一列；目标列为category时先补齐缺失的新类别"""
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            known = df[col].cat.categories
+            missing = [v for v in values.dropna().unique() if v not in known]
+            if missing:
+                df[col] = df[col].cat.add_categories(missing)
+        df.loc[idx, col] = values
+
     def compare_and_supplement(self, our_df: pd.DataFrame,
-                               systemhc_data: Dict[str, Dict]) -> pd.DataFrame:
+                               systemhc_data: Dict[str, Dict],
+                               candidate_idx: Optional[pd.Index] = None) -> pd.DataFrame:
         """
         比较SysteMHC数据与我们的数据，并补充Unknown字段
+        传入candidate_idx时只在候选行上计算掩码，非候选行完全不扫描
         """
         print("\n" + "="*70)
         print("Comparing and Supplementing Data")
         print("="*70 + "\n")
 
+        # 每个命中的数据集只计算一次候选补充值（HLA类型/等位基因/疾病/样本）
+        hla_by_id = {}
+        alleles_by_id = {}
+        disease_by_id = {}
+        sample_by_id = {}
+        for dataset_id, info in systemhc_data.items():
+            alleles = info.get('hla_alleles') or []
+            if alleles:
+                # 从等位基因判断HLA类型
+                has_class_i, has_class_ii = _classify_hla_classes(alleles)
+                if has_class_i and has_class_ii:
+                    hla_by_id[dataset_id] = 'HLA I/II'
+                elif has_class_i:
+                    hla_by_id[dataset_id] = 'HLA I'
+                elif has_class_ii:
+                    hla_by_id[dataset_id] = 'HLA II'
+                alleles_by_id[dataset_id] = '; '.join(alleles[:10])
+
+            if info.get('diseases'):
+                disease_by_id[dataset_id] = '; '.join(info['diseases'])
+
+            if info.get('cell_types'):
+                sample_by_id[dataset_id] = f"Cell line ({', '.join(info['cell_types'][:2])})"
+            elif info.get('tissues'):
+                sample_by_id[dataset_id] = f"Tissue ({', '.join(info['tissues'][:2])})"
+
+        # 掩码 + 列级赋值代替逐行at写入；change记录从掩码命中的行导出
+        # systemhc_data的键来自候选集，掩码只需在候选子表上求值
+        sub = our_df.loc[candidate_idx] if candidate_idx is not None else our_df
+        ids = sub['dataset_id']
+        matched = ids.isin(systemhc_data.keys())
+        changes_by_id = {}
+
+        def record(dataset_id, change):
+            changes_by_id.setdefault(dataset_id, []).append(change)
+
+        # 1. 比较和补充HLA类型
+        hla_new = ids.map(hla_by_id)
+        hla_mask = (matched
+                    & sub['hla_type'].isin(['Unknown', 'HLA (需人工确认)'])
+                    & hla_new.notna())
+        hla_idx = sub.index[hla_mask]
+        for dataset_id, old, new in zip(ids[hla_mask], sub.loc[hla_idx, 'hla_type'],
+                                        hla_new[hla_mask]):
+            record(dataset_id, f"HLA type: {old} → {new}")
+        self._assign_with_categories(our_df, 'hla_type', hla_idx, hla_new[hla_mask])
+        our_df.loc[hla_idx, 'needs_manual_review'] = False
+        our_df.loc[hla_idx, 'systemhc_verified'] = True
+
+        # 2. 比较和补充疾病类型
+        disease_new = ids.map(disease_by_id)
+        disease_mask = (matched
+                        & sub['disease_type'].eq('Unknown')
+                        & disease_new.notna())
+        disease_idx = sub.index[disease_mask]
+        for dataset_id, new in zip(ids[disease_mask], disease_new[disease_mask]):
+            record(dataset_id, f"Disease: Unknown → {new}")
+        self._assign_with_categories(our_df, 'disease_type', disease_idx,
+                                     disease_new[disease_mask])
+        our_df.loc[disease_idx, 'disease_inferred'] = True
+        our_df.loc[disease_idx, 'inference_source'] = 'SysteMHC'
+
+        # 3. 比较和补充样本类型
+        sample_new = ids.map(sample_by_id)
+        sample_mask = (matched
+                       & sub['sample_type'].eq('Unknown')
+                       & sample_new.notna())
+        sample_idx = sub.index[sample_mask]
+        for dataset_id, new in zip(ids[sample_mask], sample_new[sample_mask]):
+            record(dataset_id, f"Sample type: Unknown → {new}")
+        self._assign_with_categories(our_df, 'sample_type', sample_idx,
+                                     sample_new[sample_mask])
+
+        # 4. 补充HLA等位基因信息
+        alleles_new = ids.map(alleles_by_id)
+        if 'hla_alleles' in our_df.columns:
+            empty_alleles = (sub['hla_alleles'].isna()
+                             | sub['hla_alleles'].astype(str).str.strip().eq(''))
+        else:
+            empty_alleles = pd.Series(True, index=sub.index)
+        alleles_mask = matched & alleles_new.notna() & empty_alleles
+        alleles_idx = sub.index[alleles_mask]
+        for dataset_id, new in zip(ids[alleles_mask], alleles_new[alleles_mask]):
+            record(dataset_id, f"Added HLA alleles: {new[:50]}...")
+        our_df.loc[alleles_idx, 'hla_alleles'] = alleles_new[alleles_mask]
+
+        # 按原表行序汇总更改记录：只遍历真正有更改的行，
+        # 未更改的命中行不进Python循环
         comparison_report = []
-        updated_count = 0
-
-        for idx, row in our_df.iterrows():
-            dataset_id = row['dataset_id']
-
-            if dataset_id not in systemhc_data:
-                continue
-
-            systemhc_info = systemhc_data[dataset_id]
-            changes = []
-
-            # 1. 比较和补充HLA类型
-            if row['hla_type'] == 'Unknown' or row['hla_type'] == 'HLA (需人工确认)':
-                if systemhc_info.get('hla_alleles'):
-                    # 从等位基因判断HLA类型
-                    alleles = systemhc_info['hla_alleles']
-                    has_class_i = any(re.search(r'HLA-[ABC]', a) for a in alleles)
-                    has_class_ii = any(re.search(r'HLA-D[RQPM]', a) for a in alleles)
-
-                    new_hla_type = None
-                    if has_class_i and has_class_ii:
-                        new_hla_type = 'HLA I/II'
-                    elif has_class_i:
-                        new_hla_type = 'HLA I'
-                    elif has_class_ii:
-                        new_hla_type = 'HLA II'
-
-                    if new_hla_type:
-                        changes.append(f"HLA type: {row['hla_type']} → {new_hla_type}")
-                        our_df.at[idx, 'hla_type'] = new_hla_type
-                        our_df.at[idx, 'needs_manual_review'] = False
-                        our_df.at[idx, 'systemhc_verified'] = True
-
-            # 2. 比较和补充疾病类型
-            if row['disease_type'] == 'Unknown':
-                if systemhc_info.get('diseases'):
-                    new_disease = '; '.join(systemhc_info['diseases'])
-                    changes.append(f"Disease: Unknown → {new_disease}")
-                    our_df.at[idx, 'disease_type'] = new_disease
-                    our_df.at[idx, 'disease_inferred'] = True
-                    our_df.at[idx, 'inference_source'] = 'SysteMHC'
-
-            # 3. 比较和补充样本类型
-            if row['sample_type'] == 'Unknown':
-                tissues = systemhc_info.get('tissues', [])
-                cell_types = systemhc_info.get('cell_types', [])
-
-                if cell_types:
-                    new_sample = f"Cell line ({', '.join(cell_types[:2])})"
-                    changes.append(f"Sample type: Unknown → {new_sample}")
-                    our_df.at[idx, 'sample_type'] = new_sample
-                elif tissues:
-                    new_sample = f"Tissue ({', '.join(tissues[:2])})"
-                    changes.append(f"Sample type: Unknown → {new_sample}")
-                    our_df.at[idx, 'sample_type'] = new_sample
-
-            # 4. 补充HLA等位基因信息
-            if systemhc_info.get('hla_alleles'):
-                alleles_str = '; '.join(systemhc_info['hla_alleles'][:10])
-                if pd.isna(row.get('hla_alleles')) or not row.get('hla_alleles'):
-                    our_df.at[idx, 'hla_alleles'] = alleles_str
-                    changes.append(f"Added HLA alleles: {alleles_str[:50]}...")
-
-            if changes:
-                updated_count += 1
-                comparison_report.append({
-                    'dataset_id': dataset_id,
-                    'changes': changes
-                })
-                print(f"\n✓ Updated {dataset_id}:")
-                for change in changes:
-                    print(f"    {change}")
+        changed_in_order = ids[ids.isin(changes_by_id)] if changes_by_id else ()
+        for dataset_id in changed_in_order:
+            changes = changes_by_id[dataset_id]
+            comparison_report.append({
+                'dataset_id': dataset_id,
+                'changes': changes
+            })
+            print(f"\n✓ Updated {dataset_id}:")
+            for change in changes:
+                print(f"    {change}")
+        updated_count = len(comparison_report)
 
         print(f"\n" + "="*70)
         print(f"Summary: Updated {updated_count} datasets")
@@ -283,68 +673,88 @@ class SysteMHCEnricher:
         """
         report_file = DATA_VALIDATION_DIR / "systemhc_enrichment_report.txt"
 
-        with open(report_file, 'w', encoding='utf-8') as f:
-            f.write("="*70 + "\n")
-            f.write("SysteMHC数据补充报告\n")
-            f.write("="*70 + "\n\n")
+        # 在内存里拼好整份报告，最后一次性写入
+        hla_before = before_stats.get('hla_unknown', 0)
+        hla_after = after_stats.get('hla_unknown', 0)
+        disease_before = before_stats.get('disease_unknown', 0)
+        disease_after = after_stats.get('disease_unknown', 0)
+        sample_before = before_stats.get('sample_unknown', 0)
+        sample_after = after_stats.get('sample_unknown', 0)
+
+        parts = [
+            "="*70 + "\n",
+            "SysteMHC数据补充报告\n",
+            "="*70 + "\n\n",
 
-            f.write("一、数据补充概况\n")
-            f.write("-"*70 + "\n")
-            f.write(f"总补充数据集数: {len(comparison_report)}\n\n")
+            "一、数据补充概况\n",
+            "-"*70 + "\n",
+            f"总补充数据集数: {len(comparison_report)}\n\n",
 
-            f.write("二、字段改进统计\n")
-            f.write("-"*70 + "\n")
+            "二、字段改进统计\n",
+            "-"*70 + "\n",
 
             # HLA类型改进
-            hla_before = before_stats.get('hla_unknown', 0)
-            hla_after = after_stats.get('hla_unknown', 0)
-            f.write(f"\nHLA类型:\n")
-            f.write(f"  优化前 Unknown: {hla_before}\n")
-            f.write(f"  优化后 Unknown: {hla_after}\n")
-            f.write(f"  改善: {hla_before - hla_after} 个数据集\n")
+            f"\nHLA类型:\n"
+            f"  优化前 Unknown: {hla_before}\n"
+            f"  优化后 Unknown: {hla_after}\n"
+            f"  改善: {hla_before - hla_after} 个数据集\n",
 
             # 疾病类型改进
-            disease_before = before_stats.get('disease_unknown', 0)
-            disease_after = after_stats.get('disease_unknown', 0)
-            f.write(f"\n疾病类型:\n")
-            f.write(f"  优化前 Unknown: {disease_before}\n")
-            f.write(f"  优化后 Unknown: {disease_after}\n")
-            f.write(f"  改善: {disease_before - disease_after} 个数据集\n")
+            f"\n疾病类型:\n"
+            f"  优化前 Unknown: {disease_before}\n"
+            f"  优化后 Unknown: {disease_after}\n"
+            f"  改善: {disease_before - disease_after} 个数据集\n",
 
             # 样本类型改进
-            sample_before = before_stats.get('sample_unknown', 0)
-            sample_after = after_stats.get('sample_unknown', 0)
-            f.write(f"\n样本类型:\n")
-            f.write(f"  优化前 Unknown: {sample_before}\n")
-            f.write(f"  优化后 Unknown: {sample_after}\n")
-            f.write(f"  改善: {sample_before - sample_after} 个数据集\n")
-
-            f.write("\n三、详细更改记录\n")
-            f.write("-"*70 + "\n\n")
-
-            for item in comparison_report:
-                f.write(f"{item['dataset_id']}:\n")
-                for change in item['changes']:
-                    f.write(f"  • {change}\n")
-                f.write("\n")
-
-            f.write("四、数据质量提升\n")
-            f.write("-"*70 + "\n")
-            total_before = sum([before_stats.get('hla_unknown', 0),
-                               before_stats.get('disease_unknown', 0),
-                               before_stats.get('sample_unknown', 0)])
-            total_after = sum([after_stats.get('hla_unknown', 0),
-                              after_stats.get('disease_unknown', 0),
-                              after_stats.get('sample_unknown', 0)])
-            f.write(f"\n总Unknown字段数:\n")
-            f.write(f"  优化前: {total_before}\n")
-            f.write(f"  优化后: {total_after}\n")
-            f.write(f"  改善: {total_before - total_after} 个字段\n")
-            f.write(f"  改善率: {((total_before - total_after) / total_before * 100):.1f}%\n")
+            f"\n样本类型:\n"
+            f"  优化前 Unknown: {sample_before}\n"
+            f"  优化后 Unknown: {sample_after}\n"
+            f"  改善: {sample_before - sample_after} 个数据集\n",
+
+            "\n三、详细更改记录\n",
+            "-"*70 + "\n\n",
+        ]
+
+        for item in comparison_report:
+            parts.append(f"{item['dataset_id']}:\n")
+            parts.extend(f"  • {change}\n" for change in item['changes'])
+            parts.append("\n")
+
+        total_before = sum([before_stats.get('hla_unknown', 0),
+                           before_stats.get('disease_unknown', 0),
+                           before_stats.get('sample_unknown', 0)])
+        total_after = sum([after_stats.get('hla_unknown', 0),
+                          after_stats.get('disease_unknown', 0),
+                          after_stats.get('sample_unknown', 0)])
+        parts.append(
+            "四、数据质量提升\n"
+            + "-"*70 + "\n"
+            f"\n总Unknown字段数:\n"
+            f"  优化前: {total_before}\n"
+            f"  优化后: {total_after}\n"
+            f"  改善: {total_before - total_after} 个字段\n"
+            f"  改善率: {((total_before - total_after) / total_before * 100):.1f}%\n")
+
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write(''.join(parts))
 
         print(f"✓ Enrichment report saved to: {report_file}")
 
 
+def _write_csv(df: pd.DataFrame, path: Path):
+    """写出CSV：优先pyarrow多线程写出，手动补BOM保持Excel兼容"""
+    if PYARROW_AVAILABLE:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with open(path, 'wb') as f:
+                f.write(b'\xef\xbb\xbf')  # BOM
+                pacsv.write_csv(table, f)
+            return
+        except Exception:
+            pass
+    df.to_csv(path, index=False, encoding='utf-8-sig')
+
+
 def main():
     """主函数"""
     print("\n" + "="*70)
@@ -358,14 +768,26 @@ def main():
         return
 
     print(f"Loading data from: {input_file}")
-    df = pd.read_csv(input_file)
+    # 优先用pyarrow的多线程解析器读入
+    df = None
+    if PYARROW_AVAILABLE:
+        try:
+            df = pacsv.read_csv(str(input_file)).to_pandas()
+        except Exception:
+            df = None
+    if df is None:
+        df = pd.read_csv(input_file)
+    # 低基数字符串列转category：后续isin/==在整型编码上比较
+    for col in ('hla_type', 'disease_type', 'sample_type'):
+        df[col] = df[col].astype('category')
     print(f"✓ Loaded {len(df)} datasets\n")
 
-    # 收集优化前统计
+    # 收集优化前统计：直接在布尔数组上求和，不物化筛选后的子表
     before_stats = {
-        'hla_unknown': len(df[df['hla_type'].isin(['Unknown', 'HLA (需人工确认)'])]),
-        'disease_unknown': len(df[df['disease_type'] == 'Unknown']),
-        'sample_unknown': len(df[df['sample_type'] == 'Unknown'])
+        'hla_unknown': int(df['hla_type'].isin(
+            ('Unknown', 'HLA (需人工确认)')).to_numpy().sum()),
+        'disease_unknown': int((df['disease_type'].to_numpy() == 'Unknown').sum()),
+        'sample_unknown': int((df['sample_type'].to_numpy() == 'Unknown').sum()),
     }
 
     # 找出需要补充的数据集（在SysteMHC中且有Unknown字段）
@@ -405,13 +827,15 @@ def main():
         return
 
     # 比较和补充数据
-    df_updated, comparison_report = enricher.compare_and_supplement(df, systemhc_data)
+    df_updated, comparison_report = enricher.compare_and_supplement(
+        df, systemhc_data, candidate_idx=candidates.index)
 
     # 收集优化后统计
     after_stats = {
-        'hla_unknown': len(df_updated[df_updated['hla_type'].isin(['Unknown', 'HLA (需人工确认)'])]),
-        'disease_unknown': len(df_updated[df_updated['disease_type'] == 'Unknown']),
-        'sample_unknown': len(df_updated[df_updated['sample_type'] == 'Unknown'])
+        'hla_unknown': int(df_updated['hla_type'].isin(
+            ('Unknown', 'HLA (需人工确认)')).to_numpy().sum()),
+        'disease_unknown': int((df_updated['disease_type'].to_numpy() == 'Unknown').sum()),
+        'sample_unknown': int((df_updated['sample_type'].to_numpy() == 'Unknown').sum()),
     }
 
     # 生成报告
@@ -419,7 +843,7 @@ def main():
 
     # 保存更新后的数据
     output_file = DATA_PROCESSED_DIR / "all_metadata_enriched.csv"
-    df_updated.to_csv(output_file, index=False, encoding='utf-8-sig')
+    _write_csv(df_updated, output_file)
     print(f"✓ Saved enriched data to: {output_file}")
 
     # 显示改进摘要
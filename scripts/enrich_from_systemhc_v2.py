@@ -4,24 +4,191 @@
 """
 
 import pandas as pd
+import random
 import re
+import sqlite3
 import time
 from pathlib import Path
 from typing import Dict, Optional, List
+from lxml import html as lxml_html
 from requests_html import HTMLSession, AsyncHTMLSession
 import asyncio
 
+# 可选：Playwright共享浏览器渲染，比pyppeteer每页新开进程快得多
+try:
+    from playwright.async_api import async_playwright
+    PLAYWRIGHT_AVAILABLE = True
+except ImportError:
+    PLAYWRIGHT_AVAILABLE = False
+
+# 可选：aiolimiter令牌桶限速，固定延迟改为总速率预算
+try:
+    from aiolimiter import AsyncLimiter
+    AIOLIMITER_AVAILABLE = True
+except ImportError:
+    AIOLIMITER_AVAILABLE = False
+
+# 可选：pyarrow多线程CSV读写，大表比pandas默认引擎快数倍
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 并发渲染上限与对SysteMHC的总请求速率（次/秒）
+RENDER_CONCURRENCY = 4
+RENDER_RATE = 1
+
+# 渲染结果缓存有效期：7天内重跑直接复用已渲染的HTML
+RENDER_CACHE_TTL = 7 * 24 * 3600
+
 # 项目路径配置
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 DATA_VALIDATION_DIR = PROJECT_ROOT / "data" / "validation"
 
+# 预编译正则：热循环里直接调用Pattern方法，绕开re模块的缓存查找
+# 三种等位基因写法合并为一个模式，整段页面文本只扫描一遍：
+# 基因名为1-3个字母加可选数字（HLA-A / HLA-DR / HLA-DRB1），
+# 字段为2-4段冒号分隔的数字（HLA-A*02:01 / HLA-A*02:01:01:01）
+_HLA_RE = re.compile(r'HLA-[A-Z]{1,3}\d*\*\d+:\d+(?::\d+){0,2}')
+_SPLIT_ALLELES_RE = re.compile(r'[,;/\s]+')
+_CLASS_I_MARKS = ('HLA-A', 'HLA-B', 'HLA-C')
+_CLASS_II_MARKS = ('HLA-DR', 'HLA-DQ', 'HLA-DP', 'HLA-DM')
+
+
+def _classify_hla_classes(alleles):
+    """判断等位基因列表覆盖的HLA类别，命中两类后立即短路
+
+    C级子串查找代替逐个等位基因的正则search；upper()保持原来
+    IGNORECASE匹配的大小写不敏感语义
+    """
+    has_class_i = has_class_ii = False
+    for allele in alleles:
+        allele = allele.upper()
+        if not has_class_i and any(m in allele for m in _CLASS_I_MARKS):
+            has_class_i = True
+        if not has_class_ii and any(m in allele for m in _CLASS_II_MARKS):
+            has_class_ii = True
+        if has_class_i and has_class_ii:
+            break
+    return has_class_i, has_class_ii
+
+# 疾病关键词：合并成单个带命名组的交替正则，整段文本只扫描一遍；
+# IGNORECASE直接编进模式，匹配时不再lower()整段文本
+_DISEASE_GROUP_LABELS = {
+    'Melanoma': 'Melanoma',
+    'BreastCancer': 'Breast cancer',
+    'LungCancer': 'Lung cancer',
+    'ColonCancer': 'Colon cancer',
+    'Leukemia': 'Leukemia',
+    'Lymphoma': 'Lymphoma',
+    'COVID19': 'COVID-19',
+    'Influenza': 'Influenza',
+    'Tuberculosis': 'Tuberculosis',
+    'HIV': 'HIV',
+    'Diabetes': 'Diabetes',
+    'MultipleSclerosis': 'Multiple sclerosis',
+    'Alzheimer': 'Alzheimer',
+    'Parkinson': 'Parkinson',
+}
+_DISEASE_RE = re.compile('|'.join((
+    r'(?P<Melanoma>\bmelanoma\b)',
+    r'(?P<BreastCancer>\bbreast cancer\b)',
+    r'(?P<LungCancer>\blung cancer\b)',
+    r'(?P<ColonCancer>\bcolon cancer\b)',
+    r'(?P<Leukemia>\bleukemia\b)',
+    r'(?P<Lymphoma>\blymphoma\b)',
+    r'(?P<COVID19>\b(?:COVID-19|SARS-CoV-2|coronavirus)\b)',
+    r'(?P<Influenza>\binfluenza\b)',
+    r'(?P<Tuberculosis>\btuberculosis\b)',
+    r'(?P<HIV>\bHIV\b)',
+    r'(?P<Diabetes>\bdiabetes\b)',
+    r'(?P<MultipleSclerosis>\bmultiple sclerosis\b)',
+    r'(?P<Alzheimer>\bAlzheimer)',
+    r'(?P<Parkinson>\bParkinson)',
+)), re.IGNORECASE)
+
 class SysteMHCEnricherV2:
     """SysteMHC数据补充器 (支持JavaScript渲染)"""
 
     def __init__(self):
         self.base_url = "https://systemhc.sjtu.edu.cn"
         self.session = HTMLSession()
+        self.asession = None
+        self._pw = None
+        self._browser = None
+        self._ctx = None
+        self._sem = None
+        self._limiter = None
+
+        # 渲染HTML的SQLite持久缓存（按dataset_id），命中时完全跳过浏览器
+        self._cache = sqlite3.connect(
+            str(DATA_PROCESSED_DIR / "systemhc_cache.sqlite"))
+        self._cache.execute(
+            "CREATE TABLE IF NOT EXISTS rendered_pages ("
+            "dataset_id TEXT PRIMARY KEY, html TEXT, fetched_at REAL)")
+
+    def _cache_lookup(self, dataset_id: str) -> Optional[str]:
+        """返回缓存中7天内渲染过的HTML，过期或未命中返回None"""
+        row = self._cache.execute(
+            "SELECT html, fetched_at FROM rendered_pages WHERE dataset_id = ?",
+            (dataset_id,)).fetchone()
+        if row is not None and time.time() - row[1] < RENDER_CACHE_TTL:
+            return row[0]
+        return None
+
+    def _cache_store(self, dataset_id: str, page_html: str):
+        """写入/覆盖渲染结果缓存"""
+        self._cache.execute(
+            "INSERT OR REPLACE INTO rendered_pages VALUES (?, ?, ?)",
+            (dataset_id, page_html, time.time()))
+        self._cache.commit()
+
+    async def _ensure_session(self) -> AsyncHTMLSession:
+        """懒初始化共享的AsyncHTMLSession，Chromium只启动一次"""
+        if self.asession is None:
+            self.asession = AsyncHTMLSession()
+            # 访问browser属性触发唯一一次浏览器启动
+            await self.asession.browser
+        return self.asession
+
+    async def _ensure_browser(self):
+        """懒初始化Playwright：单个浏览器进程 + 共享context，并发渲染走多标签页"""
+        if self._ctx is None:
+            self._pw = await async_playwright().start()
+            self._browser = await self._pw.chromium.launch()
+            self._ctx = await self._browser.new_context(java_script_enabled=True)
+        return self._ctx
+
+    async def _render_page(self, url: str) -> str:
+        """渲染页面并返回HTML文本（Playwright优先，回退requests-html）"""
+        if PLAYWRIGHT_AVAILABLE:
+            ctx = await self._ensure_browser()
+            page = await ctx.new_page()
+            try:
+                await page.goto(url, wait_until='networkidle', timeout=30000)
+                return await page.content()
+            finally:
+                await page.close()
+
+        asession = await self._ensure_session()
+        r = await asession.get(url)
+        await r.html.arender(timeout=30, sleep=3)
+        return r.html.html
+
+    async def close(self):
+        """关闭共享session/浏览器（连同Chromium进程）"""
+        if self._ctx is not None:
+            await self._ctx.close()
+            await self._browser.close()
+            await self._pw.stop()
+            self._pw = self._browser = self._ctx = None
+        if self.asession is not None:
+            await self.asession.close()
+            self.asession = None
+        self._cache.close()
 
     async def fetch_dataset_with_js(self, dataset_id: str) -> Optional[Dict]:
         """
@@ -29,20 +196,41 @@ class SysteMHCEnricherV2:
         """
         try:
             url = f"{self.base_url}/dataset/?dataset_id={dataset_id}"
-            print(f"  Fetching (with JS rendering): {url}")
-
-            # 创建异步session
-            asession = AsyncHTMLSession()
-            r = await asession.get(url)
-
-            # 等待JavaScript渲染
-            print(f"    Rendering JavaScript...")
-            await r.html.arender(timeout=30, sleep=3)
-
-            # 解析渲染后的内容
-            data = self._parse_rendered_page(r.html, dataset_id)
 
-            await asession.close()
+            # 缓存命中时不占渲染并发与速率额度，直接进入解析
+            page_html = self._cache_lookup(dataset_id)
+            if page_html is not None:
+                print(f"  Using cached page: {dataset_id}")
+            else:
+                # 信号量限制同时渲染的页面数，令牌桶控制总请求速率
+                async with self._sem:
+                    print(f"  Fetching (with JS rendering): {url}")
+
+                    # 指数退避+抖动重试：瞬时超时不再丢掉整次渲染，
+                    # 浏览器保持共享，每次尝试都走一遍令牌桶
+                    for attempt in range(4):
+                        if self._limiter is not None:
+                            await self._limiter.acquire()
+                        try:
+                            print(f"    Rendering JavaScript...")
+                            page_html = await self._render_page(url)
+                            break
+                        except Exception as e:
+                            if attempt == 3:
+                                raise
+                            delay = min(2 ** attempt + random.random(), 30)
+                            print(f"    ⚠ Render failed ({e}), "
+                                  f"retrying in {delay:.1f}s...")
+                            await asyncio.sleep(delay)
+
+                    if self._limiter is None:
+                        # 无限速器时退回信号量内的固定延迟
+                        await asyncio.sleep(3)
+
+                self._cache_store(dataset_id, page_html)
+
+            # 解析渲染后的内容（CPU部分在信号量外进行）
+            data = self._parse_rendered_page(page_html, dataset_id)
 
             if data and (data.get('hla_alleles') or data.get('tissues') or
                         data.get('diseases') or data.get('cell_types')):
@@ -55,10 +243,17 @@ class SysteMHCEnricherV2:
             print(f"    ✗ Error: {e}")
             return None
 
-    def _parse_rendered_page(self, html, dataset_id: str) -> Dict:
+    def _parse_rendered_page(self, page_html: str, dataset_id: str) -> Dict:
         """
-        从渲染后的页面提取信息
+        从渲染后的页面HTML提取信息（lxml的C实现DOM遍历）
         """
+        # dict当有序集合用：O(1)成员判断并保留首次出现顺序，
+        # 替代每次append前的线性 not in 扫描
+        organisms = {}
+        tissues = {}
+        cell_types = {}
+        hla_alleles = {}
+
         data = {
             'dataset_id': dataset_id,
             'hla_alleles': [],
@@ -68,151 +263,161 @@ class SysteMHCEnricherV2:
             'organisms': []
         }
 
-        # 获取页面文本
-        page_text = html.text
+        root = lxml_html.fromstring(page_html)
 
-        # 方法1: 查找表格（使用pyquery选择器）
-        try:
-            # 查找dataset表格
-            tables = html.find('table')
-            for table in tables:
-                # 查找所有行
-                rows = table.find('tr')
-                for row in rows[1:]:  # 跳过表头
-                    cells = row.find('td')
-                    if len(cells) >= 3:
-                        # 提取Organism
-                        if len(cells) > 2:
-                            organism = cells[2].text.strip()
-                            if organism and organism not in data['organisms']:
-                                data['organisms'].append(organism)
-
-                        # 提取TissueType
-                        if len(cells) > 3:
-                            tissue = cells[3].text.strip()
-                            if tissue and tissue not in ['', '-', 'N/A']:
-                                if tissue not in data['tissues']:
-                                    data['tissues'].append(tissue)
-
-                        # 提取CellType
-                        if len(cells) > 4:
-                            cell_type = cells[4].text.strip()
-                            if cell_type and cell_type not in ['', '-', 'N/A']:
-                                if cell_type not in data['cell_types']:
-                                    data['cell_types'].append(cell_type)
-
-                        # 提取MHCAllele
-                        if len(cells) > 5:
-                            mhc = cells[5].text.strip()
-                            if mhc and mhc not in ['', '-', 'N/A']:
-                                # 分割多个等位基因
-                                alleles = re.split(r'[,;/\s]+', mhc)
-                                for allele in alleles:
-                                    allele = allele.strip()
-                                    if allele and allele not in data['hla_alleles']:
-                                        data['hla_alleles'].append(allele)
-        except Exception as e:
-            print(f"    ⚠ Table parsing error: {e}")
+        # 获取页面文本
+        page_text = root.text_content()
+
+        # 方法1: 查找表格（XPath，逐表跳过首行表头）
+        # 先用C级子串探测：无<table>的页面直接跳过整个DOM表格遍历
+        tables = root.xpath('//table') if '<table' in page_html else ()
+        for table in tables:
+            for row in table.xpath('.//tr')[1:]:
+                cells = row.xpath('./td')
+                if len(cells) >= 3:
+                    # 提取Organism
+                    organism = cells[2].text_content().strip()
+                    if organism:
+                        organisms[organism] = None
+
+                    # 提取TissueType
+                    if len(cells) > 3:
+                        tissue = cells[3].text_content().strip()
+                        if tissue and tissue not in ('-', 'N/A'):
+                            tissues[tissue] = None
+
+                    # 提取CellType
+                    if len(cells) > 4:
+                        cell_type = cells[4].text_content().strip()
+                        if cell_type and cell_type not in ('-', 'N/A'):
+                            cell_types[cell_type] = None
+
+                    # 提取MHCAllele
+                    if len(cells) > 5:
+                        mhc = cells[5].text_content().strip()
+                        if mhc and mhc not in ('-', 'N/A'):
+                            # 分割多个等位基因
+                            for allele in _SPLIT_ALLELES_RE.split(mhc):
+                                allele = allele.strip()
+                                if allele:
+                                    hla_alleles[allele] = None
+
+        # 表格是否已给出有用信息：是的话方法4的区域扫描纯属冗余
+        table_hit = bool(tissues or cell_types or hla_alleles)
 
         # 方法2: 使用正则表达式从整个页面提取HLA信息
-        hla_patterns = [
-            r'HLA-[A-Z]\*\d+:\d+(?::\d+)?(?::\d+)?',  # HLA-A*02:01
-            r'HLA-[A-Z][A-Z]\*\d+:\d+',               # HLA-DR*01:01
-            r'HLA-[A-Z][A-Z][A-Z]\d+\*\d+:\d+',       # HLA-DRB1*01:01
-        ]
-
-        for pattern in hla_patterns:
-            matches = re.findall(pattern, page_text)
-            for match in matches:
-                if match not in data['hla_alleles']:
-                    data['hla_alleles'].append(match)
+        # 子串探测先行：页面完全没有HLA-记号时跳过正则扫描
+        if 'HLA-' in page_text:
+            hla_alleles.update(dict.fromkeys(_HLA_RE.findall(page_text)))
 
         # 方法3: 从页面文本提取疾病信息
         self._extract_diseases_from_text(page_text, data['diseases'])
 
-        # 方法4: 查找特定的div或section
-        try:
-            # 查找可能包含元数据的区域
-            info_sections = html.find('.info, .metadata, .details, [class*="info"]')
-            for section in info_sections:
-                text = section.text
-                # 提取疾病
-                self._extract_diseases_from_text(text, data['diseases'])
-
-                # 提取组织类型
-                tissue_keywords = ['tissue', 'organ', 'sample']
-                for keyword in tissue_keywords:
-                    if keyword in text.lower():
-                        # 尝试提取相关信息
-                        lines = text.split('\n')
-                        for line in lines:
-                            if keyword in line.lower():
-                                # 简单提取
-                                parts = line.split(':')
-                                if len(parts) > 1:
-                                    value = parts[1].strip()
-                                    if value and value not in data['tissues']:
-                                        data['tissues'].append(value)
-        except Exception as e:
-            print(f"    ⚠ Section parsing error: {e}")
+        # 方法4: 查找特定的div或section（表格已命中时跳过该冗余扫描）
+        if not table_hit:
+            try:
+                # 查找可能包含元数据的区域
+                info_sections = root.xpath(
+                    "//*[contains(@class,'info') or contains(@class,'metadata')"
+                    " or contains(@class,'details')]")
+                for section in info_sections:
+                    text = section.text_content()
+                    # 提取疾病
+                    self._extract_diseases_from_text(text, data['diseases'])
+
+                    # 提取组织类型
+                    tissue_keywords = ['tissue', 'organ', 'sample']
+                    for keyword in tissue_keywords:
+                        if keyword in text.lower():
+                            # 尝试提取相关信息
+                            lines = text.split('\n')
+                            for line in lines:
+                                if keyword in line.lower():
+                                    # 简单提取
+                                    parts = line.split(':')
+                                    if len(parts) > 1:
+                                        value = parts[1].strip()
+                                        if value:
+                                            tissues[value] = None
+            except Exception as e:
+                print(f"    ⚠ Section parsing error: {e}")
+
+        data['organisms'] = list(organisms)
+        data['tissues'] = list(tissues)
+        data['cell_types'] = list(cell_types)
+        data['hla_alleles'] = list(hla_alleles)
 
         return data
 
     def _extract_diseases_from_text(self, text: str, diseases_list: List):
-        """从文本中提取疾病关键词"""
-        disease_patterns = {
-            'Melanoma': r'\bmelanoma\b',
-            'Breast cancer': r'\bbreast cancer\b',
-            'Lung cancer': r'\blung cancer\b',
-            'Colon cancer': r'\bcolon cancer\b',
-            'Leukemia': r'\bleukemia\b',
-            'Lymphoma': r'\blymphoma\b',
-            'COVID-19': r'\b(?:COVID-19|SARS-CoV-2|coronavirus)\b',
-            'Influenza': r'\binfluenza\b',
-            'Tuberculosis': r'\btuberculosis\b',
-            'HIV': r'\bHIV\b',
-            'Diabetes': r'\bdiabetes\b',
-            'Multiple sclerosis': r'\bmultiple sclerosis\b',
-            'Alzheimer': r'\bAlzheimer',
-            'Parkinson': r'\bParkinson',
-        }
-
-        text_lower = text.lower()
-        for disease, pattern in disease_patterns.items():
-            if re.search(pattern, text_lower):
-                if disease not in diseases_list:
-                    diseases_list.append(disease)
+        """从文本中提取疾病关键词（单次finditer扫描命中所有关键词）"""
+        found = {m.lastgroup for m in _DISEASE_RE.finditer(text)}
+        if not found:
+            return
+        # 按关键词表的固定顺序追加，保持输出顺序稳定
+        for group, label in _DISEASE_GROUP_LABELS.items():
+            if group in found and label not in diseases_list:
+                diseases_list.append(label)
+
+    async def _fetch_one(self, i: int, total: int, dataset_id: str):
+        """抓取单个数据集并打印进度摘要"""
+        print(f"\n[{i}/{total}] Processing {dataset_id}")
+        data = await self.fetch_dataset_with_js(dataset_id)
+
+        if data:
+            print(f"    ✓ Extracted:")
+            if data.get('hla_alleles'):
+                print(f"      HLA: {len(data['hla_alleles'])} alleles")
+            if data.get('tissues'):
+                print(f"      Tissues: {', '.join(data['tissues'][:3])}")
+            if data.get('cell_types'):
+                print(f"      Cell types: {', '.join(data['cell_types'][:3])}")
+            if data.get('diseases'):
+                print(f"      Diseases: {', '.join(data['diseases'])}")
+
+        return dataset_id, data
 
     async def batch_fetch_async(self, dataset_ids: List[str]) -> Dict[str, Dict]:
         """
-        批量异步获取数据集信息
+        批量异步获取数据集信息（有界并发代替串行逐个等待）
         """
-        results = {}
         total = len(dataset_ids)
+        self._sem = asyncio.Semaphore(RENDER_CONCURRENCY)
+        self._limiter = (AsyncLimiter(RENDER_RATE, 1)
+                         if AIOLIMITER_AVAILABLE else None)
+        # 并发任务启动前先建好共享浏览器，避免竞态下重复启动
+        if dataset_ids:
+            if PLAYWRIGHT_AVAILABLE:
+                await self._ensure_browser()
+            else:
+                await self._ensure_session()
 
-        for i, dataset_id in enumerate(dataset_ids, 1):
-            print(f"\n[{i}/{total}] Processing {dataset_id}")
-
-            data = await self.fetch_dataset_with_js(dataset_id)
+        results_list = await asyncio.gather(
+            *(self._fetch_one(i, total, did)
+              for i, did in enumerate(dataset_ids, 1)),
+            return_exceptions=True)
 
+        results = {}
+        for item in results_list:
+            if isinstance(item, BaseException):
+                print(f"    ✗ Error: {item}")
+                continue
+            dataset_id, data = item
             if data:
                 results[dataset_id] = data
-                print(f"    ✓ Extracted:")
-                if data.get('hla_alleles'):
-                    print(f"      HLA: {len(data['hla_alleles'])} alleles")
-                if data.get('tissues'):
-                    print(f"      Tissues: {', '.join(data['tissues'][:3])}")
-                if data.get('cell_types'):
-                    print(f"      Cell types: {', '.join(data['cell_types'][:3])}")
-                if data.get('diseases'):
-                    print(f"      Diseases: {', '.join(data['diseases'])}")
-
-            # 延迟，避免过载
-            if i < total:
-                await asyncio.sleep(3)
-
         return results
 
+    @staticmethod
+    def _assign_with_categories(df: pd.DataFrame, col: str,
+                                mask: pd.Series, values: pd.Series):
+        """按掩码写入一列；目标列为category时先补齐缺失的新类别"""
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            known = df[col].cat.categories
+            missing = [v for v in values.dropna().unique() if v not in known]
+            if missing:
+                df[col] = df[col].cat.add_categories(missing)
+        df.loc[mask, col] = values
+
     def compare_and_supplement(self, our_df: pd.DataFrame,
                                systemhc_data: Dict[str, Dict]) -> tuple:
         """
@@ -222,79 +427,104 @@ class SysteMHCEnricherV2:
         print("Comparing and Supplementing Data")
         print("="*70 + "\n")
 
+        # 每个命中的数据集只计算一次候选补充值（HLA类型/等位基因/疾病/样本）
+        hla_by_id = {}
+        alleles_by_id = {}
+        alleles_count_by_id = {}
+        disease_by_id = {}
+        sample_by_id = {}
+        for dataset_id, info in systemhc_data.items():
+            alleles = info.get('hla_alleles') or []
+            if alleles:
+                # 从等位基因判断HLA类型
+                has_class_i, has_class_ii = _classify_hla_classes(alleles)
+                if has_class_i and has_class_ii:
+                    hla_by_id[dataset_id] = 'HLA I/II'
+                elif has_class_i:
+                    hla_by_id[dataset_id] = 'HLA I'
+                elif has_class_ii:
+                    hla_by_id[dataset_id] = 'HLA II'
+                alleles_by_id[dataset_id] = '; '.join(alleles[:15])
+                alleles_count_by_id[dataset_id] = len(alleles)
+
+            if info.get('diseases'):
+                disease_by_id[dataset_id] = '; '.join(info['diseases'])
+
+            if info.get('cell_types'):
+                sample_by_id[dataset_id] = f"Cell line ({', '.join(info['cell_types'][:2])})"
+            elif info.get('tissues'):
+                sample_by_id[dataset_id] = f"Tissue ({', '.join(info['tissues'][:2])})"
+
+        # 掩码 + 列级赋值代替iterrows逐行at写入；change记录从掩码命中的行导出
+        ids = our_df['dataset_id']
+        matched = ids.isin(systemhc_data.keys())
+        changes_by_id = {}
+
+        def record(dataset_id, change):
+            changes_by_id.setdefault(dataset_id, []).append(change)
+
+        # 1. 补充HLA类型
+        hla_new = ids.map(hla_by_id)
+        hla_mask = (matched
+                    & our_df['hla_type'].isin(['Unknown', 'HLA (需人工确认)'])
+                    & hla_new.notna())
+        for dataset_id, old, new in zip(ids[hla_mask], our_df.loc[hla_mask, 'hla_type'],
+                                        hla_new[hla_mask]):
+            record(dataset_id, f"HLA type: {old} → {new}")
+        self._assign_with_categories(our_df, 'hla_type', hla_mask, hla_new[hla_mask])
+        our_df.loc[hla_mask, 'needs_manual_review'] = False
+        our_df.loc[hla_mask, 'systemhc_verified'] = True
+
+        # 2. 补充疾病类型
+        disease_new = ids.map(disease_by_id)
+        disease_mask = (matched
+                        & our_df['disease_type'].eq('Unknown')
+                        & disease_new.notna())
+        for dataset_id, new in zip(ids[disease_mask], disease_new[disease_mask]):
+            record(dataset_id, f"Disease: Unknown → {new}")
+        self._assign_with_categories(our_df, 'disease_type', disease_mask,
+                                     disease_new[disease_mask])
+        our_df.loc[disease_mask, 'disease_inferred'] = True
+        our_df.loc[disease_mask, 'inference_source'] = 'SysteMHC'
+
+        # 3. 补充样本类型
+        sample_new = ids.map(sample_by_id)
+        sample_mask = (matched
+                       & our_df['sample_type'].eq('Unknown')
+                       & sample_new.notna())
+        for dataset_id, new in zip(ids[sample_mask], sample_new[sample_mask]):
+            record(dataset_id, f"Sample type: Unknown → {new}")
+        self._assign_with_categories(our_df, 'sample_type', sample_mask,
+                                     sample_new[sample_mask])
+
+        # 4. 补充HLA等位基因
+        alleles_new = ids.map(alleles_by_id)
+        if 'hla_alleles' in our_df.columns:
+            empty_alleles = (our_df['hla_alleles'].isna()
+                             | our_df['hla_alleles'].astype(str).eq(''))
+        else:
+            empty_alleles = pd.Series(True, index=our_df.index)
+        alleles_mask = matched & alleles_new.notna() & empty_alleles
+        for dataset_id in ids[alleles_mask]:
+            record(dataset_id, f"Added HLA alleles ({alleles_count_by_id[dataset_id]})")
+        our_df.loc[alleles_mask, 'hla_alleles'] = alleles_new[alleles_mask]
+
+        # 按原表行序汇总更改记录
         comparison_report = []
-        updated_count = 0
-
-        for idx, row in our_df.iterrows():
-            dataset_id = row['dataset_id']
-
-            if dataset_id not in systemhc_data:
-                continue
-
-            systemhc_info = systemhc_data[dataset_id]
-            changes = []
-
-            # 1. 补充HLA类型
-            if row['hla_type'] in ['Unknown', 'HLA (需人工确认)']:
-                if systemhc_info.get('hla_alleles'):
-                    alleles = systemhc_info['hla_alleles']
-                    has_class_i = any(re.search(r'HLA-[ABC]', a, re.I) for a in alleles)
-                    has_class_ii = any(re.search(r'HLA-D[RQPM]', a, re.I) for a in alleles)
-
-                    new_hla_type = None
-                    if has_class_i and has_class_ii:
-                        new_hla_type = 'HLA I/II'
-                    elif has_class_i:
-                        new_hla_type = 'HLA I'
-                    elif has_class_ii:
-                        new_hla_type = 'HLA II'
-
-                    if new_hla_type:
-                        changes.append(f"HLA type: {row['hla_type']} → {new_hla_type}")
-                        our_df.at[idx, 'hla_type'] = new_hla_type
-                        our_df.at[idx, 'needs_manual_review'] = False
-                        our_df.at[idx, 'systemhc_verified'] = True
-
-            # 2. 补充疾病类型
-            if row['disease_type'] == 'Unknown':
-                if systemhc_info.get('diseases'):
-                    new_disease = '; '.join(systemhc_info['diseases'])
-                    changes.append(f"Disease: Unknown → {new_disease}")
-                    our_df.at[idx, 'disease_type'] = new_disease
-                    our_df.at[idx, 'disease_inferred'] = True
-                    our_df.at[idx, 'inference_source'] = 'SysteMHC'
-
-            # 3. 补充样本类型
-            if row['sample_type'] == 'Unknown':
-                tissues = systemhc_info.get('tissues', [])
-                cell_types = systemhc_info.get('cell_types', [])
-
-                if cell_types:
-                    new_sample = f"Cell line ({', '.join(cell_types[:2])})"
-                    changes.append(f"Sample type: Unknown → {new_sample}")
-                    our_df.at[idx, 'sample_type'] = new_sample
-                elif tissues:
-                    new_sample = f"Tissue ({', '.join(tissues[:2])})"
-                    changes.append(f"Sample type: Unknown → {new_sample}")
-                    our_df.at[idx, 'sample_type'] = new_sample
-
-            # 4. 补充HLA等位基因
-            if systemhc_info.get('hla_alleles'):
-                alleles_str = '; '.join(systemhc_info['hla_alleles'][:15])
-                current = row.get('hla_alleles')
-                if pd.isna(current) or not current or current == '':
-                    our_df.at[idx, 'hla_alleles'] = alleles_str
-                    changes.append(f"Added HLA alleles ({len(systemhc_info['hla_alleles'])})")
-
-            if changes:
-                updated_count += 1
-                comparison_report.append({
-                    'dataset_id': dataset_id,
-                    'changes': changes
-                })
-                print(f"\n✓ Updated {dataset_id}:")
-                for change in changes:
-                    print(f"    {change}")
+        changed_in_order = ids[ids.isin(changes_by_id)] if changes_by_id else ()
+        # 更新日志先聚合再一次性输出，避免每行一次print+flush
+        log_lines = []
+        for dataset_id in changed_in_order:
+            changes = changes_by_id[dataset_id]
+            comparison_report.append({
+                'dataset_id': dataset_id,
+                'changes': changes
+            })
+            log_lines.append(f"\n✓ Updated {dataset_id}:")
+            log_lines.extend(f"    {change}" for change in changes)
+        if log_lines:
+            print('\n'.join(log_lines))
+        updated_count = len(comparison_report)
 
         print(f"\n" + "="*70)
         print(f"Summary: Updated {updated_count} datasets")
@@ -309,71 +539,92 @@ class SysteMHCEnricherV2:
         """
         report_file = DATA_VALIDATION_DIR / "systemhc_enrichment_report.txt"
 
+        hla_before = before_stats.get('hla_unknown', 0)
+        hla_after = after_stats.get('hla_unknown', 0)
+        disease_before = before_stats.get('disease_unknown', 0)
+        disease_after = after_stats.get('disease_unknown', 0)
+        sample_before = before_stats.get('sample_unknown', 0)
+        sample_after = after_stats.get('sample_unknown', 0)
+
+        # 在内存中拼好整份报告，最后一次性编码写入
+        parts = [
+            "="*70 + "\n",
+            "SysteMHC数据补充报告 (JavaScript渲染版)\n",
+            "="*70 + "\n\n",
+
+            "一、数据补充概况\n",
+            "-"*70 + "\n",
+            f"总补充数据集数: {len(comparison_report)}\n\n",
+
+            "二、字段改进统计\n",
+            "-"*70 + "\n",
+
+            f"\nHLA类型:\n",
+            f"  优化前 Unknown: {hla_before}\n",
+            f"  优化后 Unknown: {hla_after}\n",
+            f"  改善: {hla_before - hla_after} 个数据集\n",
+
+            f"\n疾病类型:\n",
+            f"  优化前 Unknown: {disease_before}\n",
+            f"  优化后 Unknown: {disease_after}\n",
+            f"  改善: {disease_before - disease_after} 个数据集\n",
+
+            f"\n样本类型:\n",
+            f"  优化前 Unknown: {sample_before}\n",
+            f"  优化后 Unknown: {sample_after}\n",
+            f"  改善: {sample_before - sample_after} 个数据集\n",
+
+            "\n三、详细更改记录\n",
+            "-"*70 + "\n\n",
+        ]
+
+        for item in comparison_report:
+            parts.append(f"{item['dataset_id']}:\n")
+            parts.extend(f"  • {change}\n" for change in item['changes'])
+            parts.append("\n")
+
+        if comparison_report:
+            total_before = hla_before + disease_before + sample_before
+            total_after = hla_after + disease_after + sample_after
+
+            parts.append(
+                "四、数据质量提升\n"
+                + "-"*70 + "\n"
+                f"\n总Unknown字段数:\n"
+                f"  优化前: {total_before}\n"
+                f"  优化后: {total_after}\n"
+                f"  改善: {total_before - total_after} 个字段\n")
+            if total_before > 0:
+                parts.append(
+                    f"  改善率: {((total_before - total_after) / total_before * 100):.1f}%\n")
+
         with open(report_file, 'w', encoding='utf-8') as f:
-            f.write("="*70 + "\n")
-            f.write("SysteMHC数据补充报告 (JavaScript渲染版)\n")
-            f.write("="*70 + "\n\n")
-
-            f.write("一、数据补充概况\n")
-            f.write("-"*70 + "\n")
-            f.write(f"总补充数据集数: {len(comparison_report)}\n\n")
-
-            f.write("二、字段改进统计\n")
-            f.write("-"*70 + "\n")
-
-            # HLA类型
-            hla_before = before_stats.get('hla_unknown', 0)
-            hla_after = after_stats.get('hla_unknown', 0)
-            f.write(f"\nHLA类型:\n")
-            f.write(f"  优化前 Unknown: {hla_before}\n")
-            f.write(f"  优化后 Unknown: {hla_after}\n")
-            f.write(f"  改善: {hla_before - hla_after} 个数据集\n")
-
-            # 疾病类型
-            disease_before = before_stats.get('disease_unknown', 0)
-            disease_after = after_stats.get('disease_unknown', 0)
-            f.write(f"\n疾病类型:\n")
-            f.write(f"  优化前 Unknown: {disease_before}\n")
-            f.write(f"  优化后 Unknown: {disease_after}\n")
-            f.write(f"  改善: {disease_before - disease_after} 个数据集\n")
-
-            # 样本类型
-            sample_before = before_stats.get('sample_unknown', 0)
-            sample_after = after_stats.get('sample_unknown', 0)
-            f.write(f"\n样本类型:\n")
-            f.write(f"  优化前 Unknown: {sample_before}\n")
-            f.write(f"  优化后 Unknown: {sample_after}\n")
-            f.write(f"  改善: {sample_before - sample_after} 个数据集\n")
-
-            f.write("\n三、详细更改记录\n")
-            f.write("-"*70 + "\n\n")
-
-            for item in comparison_report:
-                f.write(f"{item['dataset_id']}:\n")
-                for change in item['changes']:
-                    f.write(f"  • {change}\n")
-                f.write("\n")
-
-            if comparison_report:
-                total_before = sum([before_stats.get('hla_unknown', 0),
-                                   before_stats.get('disease_unknown', 0),
-                                   before_stats.get('sample_unknown', 0)])
-                total_after = sum([after_stats.get('hla_unknown', 0),
-                                  after_stats.get('disease_unknown', 0),
-                                  after_stats.get('sample_unknown', 0)])
-
-                f.write("四、数据质量提升\n")
-                f.write("-"*70 + "\n")
-                f.write(f"\n总Unknown字段数:\n")
-                f.write(f"  优化前: {total_before}\n")
-                f.write(f"  优化后: {total_after}\n")
-                f.write(f"  改善: {total_before - total_after} 个字段\n")
-                if total_before > 0:
-                    f.write(f"  改善率: {((total_before - total_after) / total_before * 100):.1f}%\n")
+            f.write(''.join(parts))
 
         print(f"✓ Enrichment report saved to: {report_file}")
 
 
+def _write_csv(df: pd.DataFrame, path: Path):
+    """写出CSV：优先pyarrow多线程写出，手动补BOM保持Excel兼容"""
+    if PYARROW_AVAILABLE:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with open(path, 'wb') as f:
+                f.write(b'\xef\xbb\xbf')  # BOM
+                pacsv.write_csv(table, f)
+            return
+        except Exception:
+            pass
+    df.to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def _unknown_masks(df: pd.DataFrame):
+    """一次构造三个Unknown布尔掩码，统计与候选筛选共用"""
+    return (df['hla_type'].isin(['Unknown', 'HLA (需人工确认)']),
+            df['disease_type'] == 'Unknown',
+            df['sample_type'] == 'Unknown')
+
+
 async def main_async():
     """异步主函数"""
     print("\n" + "="*70)
@@ -387,30 +638,38 @@ async def main_async():
         return
 
     print(f"Loading data from: {input_file}")
-    df = pd.read_csv(input_file)
+    # 低基数字符串列按category处理：掩码比较走int8编码而不是逐行Python字符串。
+    # 整表仍需完整读入，因为补充后要原样写回所有列
+    if PYARROW_AVAILABLE:
+        # pyarrow多线程读取（自动识别utf-8-sig BOM）
+        df = pacsv.read_csv(str(input_file)).to_pandas()
+        for col in ('hla_type', 'disease_type', 'sample_type'):
+            df[col] = df[col].astype('category')
+    else:
+        # pandas回退路径：解析阶段直接按category建列，省去事后astype拷贝
+        df = pd.read_csv(input_file, dtype={
+            'hla_type': 'category',
+            'disease_type': 'category',
+            'sample_type': 'category',
+        })
     print(f"✓ Loaded {len(df)} datasets\n")
 
-    # 收集优化前统计
+    # 收集优化前统计：掩码只构造一次，候选筛选复用同一批布尔数组
+    hla_mask, disease_mask, sample_mask = _unknown_masks(df)
     before_stats = {
-        'hla_unknown': len(df[df['hla_type'].isin(['Unknown', 'HLA (需人工确认)'])]),
-        'disease_unknown': len(df[df['disease_type'] == 'Unknown']),
-        'sample_unknown': len(df[df['sample_type'] == 'Unknown'])
+        'hla_unknown': int(hla_mask.sum()),
+        'disease_unknown': int(disease_mask.sum()),
+        'sample_unknown': int(sample_mask.sum())
     }
 
     # 找出需要补充的数据集
-    candidates = df[
-        (df['in_systemhc'] == True) &
-        (
-            (df['disease_type'] == 'Unknown') |
-            (df['sample_type'] == 'Unknown') |
-            (df['hla_type'].isin(['Unknown', 'HLA (需人工确认)']))
-        )
-    ]
+    in_systemhc = df['in_systemhc']
+    candidates = df[in_systemhc & (disease_mask | sample_mask | hla_mask)]
 
     print(f"Found {len(candidates)} datasets to enrich")
-    print(f"  Disease Unknown: {len(candidates[candidates['disease_type'] == 'Unknown'])}")
-    print(f"  Sample Unknown: {len(candidates[candidates['sample_type'] == 'Unknown'])}")
-    print(f"  HLA Unknown: {len(candidates[candidates['hla_type'].isin(['Unknown', 'HLA (需人工确认)'])])}\n")
+    print(f"  Disease Unknown: {int((in_systemhc & disease_mask).sum())}")
+    print(f"  Sample Unknown: {int((in_systemhc & sample_mask).sum())}")
+    print(f"  HLA Unknown: {int((in_systemhc & hla_mask).sum())}\n")
 
     # 限制数量以测试（处理前5个）
     test_mode = True
@@ -428,8 +687,11 @@ async def main_async():
     print(f"Note: First run will download Chromium (~150MB)")
     print(f"This may take ~10-15 seconds per dataset\n")
 
-    # 批量获取数据
-    systemhc_data = await enricher.batch_fetch_async(dataset_ids)
+    # 批量获取数据（结束后确保关闭共享浏览器）
+    try:
+        systemhc_data = await enricher.batch_fetch_async(dataset_ids)
+    finally:
+        await enricher.close()
 
     print(f"\n✓ Successfully extracted data for {len(systemhc_data)} datasets")
 
@@ -445,10 +707,11 @@ async def main_async():
     df_updated, comparison_report = enricher.compare_and_supplement(df, systemhc_data)
 
     # 收集优化后统计
+    hla_mask, disease_mask, sample_mask = _unknown_masks(df_updated)
     after_stats = {
-        'hla_unknown': len(df_updated[df_updated['hla_type'].isin(['Unknown', 'HLA (需人工确认)'])]),
-        'disease_unknown': len(df_updated[df_updated['disease_type'] == 'Unknown']),
-        'sample_unknown': len(df_updated[df_updated['sample_type'] == 'Unknown'])
+        'hla_unknown': int(hla_mask.sum()),
+        'disease_unknown': int(disease_mask.sum()),
+        'sample_unknown': int(sample_mask.sum())
     }
 
     # 生成报告
@@ -456,7 +719,7 @@ async def main_async():
 
     # 保存结果
     output_file = DATA_PROCESSED_DIR / "all_metadata_enriched.csv"
-    df_updated.to_csv(output_file, index=False, encoding='utf-8-sig')
+    _write_csv(df_updated, output_file)
     print(f"✓ Saved to: {output_file}")
 
     # 摘要
@@ -13,20 +13,116 @@ import warnings
 warnings.filterwarnings('ignore')
 
 try:
-    from openpyxl import load_workbook
-    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    from openpyxl.utils.dataframe import dataframe_to_rows
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill, Alignment, NamedStyle
+    from openpyxl.utils import get_column_letter
     OPENPYXL_AVAILABLE = True
+
+    # 表头样式只构造一次：NamedStyle注册到工作簿后按名字引用，
+    # 每个表头单元格不再新建Font/Fill/Alignment对象
+    _HEADER_STYLE = NamedStyle(
+        name='hdr',
+        font=Font(color="FFFFFF", bold=True, size=11),
+        fill=PatternFill(start_color="366092", end_color="366092",
+                         fill_type="solid"),
+        alignment=Alignment(horizontal="center", vertical="center",
+                            wrap_text=True))
 except ImportError:
     OPENPYXL_AVAILABLE = False
     print("Warning: openpyxl not available. Excel formatting will be limited.")
 
+# 可选：pyarrow解析引擎，多线程读CSV且字符串列用Arrow存储（内存约为object的1/4）
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # 项目路径配置
 PROJECT_ROOT = Path(__file__).parent.parent
 DATA_PROCESSED_DIR = PROJECT_ROOT / "data" / "processed"
 DATA_VALIDATION_DIR = PROJECT_ROOT / "data" / "validation"
 
 
+# 被多个汇总表反复value_counts的列：转category后计数走内部编码数组
+_COUNTED_COLUMNS = ('repository', 'hla_type', 'sample_type',
+                    'disease_category', 'disease_type', 'metadata_quality')
+
+# 主表关键列及其中文表头：模块级常量，避免每次生成报告时重建
+MAIN_COLUMNS = (
+    'dataset_id',
+    'repository',
+    'title',
+    'hla_type',
+    'disease_type',
+    'disease_category',
+    'is_healthy',
+    'sample_type',
+    'organisms',
+    'tissues',
+    'cell_types',
+    'instruments',
+    'ptms',
+    'project_tags',
+    'keywords',
+    'publication_date',
+    'pubmed_ids',
+    'pride_url',
+    'metadata_quality',
+    'needs_manual_review',
+)
+
+COLUMN_NAMES_ZH = {
+    'dataset_id': '数据集ID',
+    'repository': '数据库',
+    'title': '标题',
+    'hla_type': 'HLA类型',
+    'disease_type': '疾病类型',
+    'disease_category': '疾病类别',
+    'is_healthy': '健康对照',
+    'sample_type': '样本类型',
+    'organisms': '物种',
+    'tissues': '组织',
+    'cell_types': '细胞类型',
+    'instruments': '质谱仪器',
+    'ptms': '翻译后修饰',
+    'project_tags': '项目标签',
+    'keywords': '关键词',
+    'publication_date': '发表日期',
+    'pubmed_ids': 'PubMed ID',
+    'pride_url': 'URL',
+    'metadata_quality': '元数据质量',
+    'needs_manual_review': '需人工审核',
+}
+
+
+def _top_counts(series: pd.Series, n: int,
+                name_col: str, count_col: str) -> pd.DataFrame:
+    """分号分隔的多值列 → 前n项频次表
+
+    优先走Arrow计算内核：split/flatten/trim/value_counts全程
+    不物化Python字符串；pyarrow不可用时退回pandas的C路径
+    """
+    if PYARROW_AVAILABLE:
+        tokens = pc.utf8_trim_whitespace(pc.list_flatten(
+            pc.split_pattern(pa.array(series.dropna().astype(str)), ';')))
+        token_counts = tokens.value_counts()
+        counts = (pd.Series(token_counts.field('counts').to_pylist(),
+                            index=token_counts.field('values').to_pylist())
+                  .loc[lambda s: (s.index != '') & (s.index != 'nan')]
+                  .sort_values(ascending=False, kind='stable').head(n))
+    else:
+        counts = (series.dropna().astype(str)
+                  .str.split(';').explode().str.strip()
+                  .loc[lambda s: s.ne('') & s.ne('nan')]
+                  .value_counts().head(n))
+    if counts.empty:
+        return pd.DataFrame([['无数据', 0]], columns=[name_col, count_col])
+    return counts.rename_axis(name_col).reset_index(name=count_col)
+
+
 class ExcelReportGenerator:
     """Excel报告生成器"""
 
@@ -63,7 +159,22 @@ class ExcelReportGenerator:
             print("  Please run classify_metadata.py first")
             sys.exit(1)
 
-        df = pd.read_csv(input_file)
+        if PYARROW_AVAILABLE:
+            # Arrow后端：布尔/字符串列走Arrow计算内核而不是object逐行比较
+            df = pd.read_csv(input_file, engine='pyarrow',
+                             dtype_backend='pyarrow')
+            # pyarrow会把ISO日期列推断成日期类型，Excel单元格会多出
+            # " 00:00:00"时间部分；转回YYYY-MM-DD字符串保持原样输出
+            if ('publication_date' in df.columns and
+                    pd.api.types.is_datetime64_any_dtype(df['publication_date'])):
+                df['publication_date'] = (
+                    df['publication_date'].dt.strftime('%Y-%m-%d'))
+        else:
+            df = pd.read_csv(input_file)
+
+        # 低基数统计列转category：后续每次value_counts为O(类别数)
+        for col in _COUNTED_COLUMNS:
+            df[col] = df[col].astype('category')
         print(f"✓ Loaded {len(df)} datasets\n")
 
         return df
@@ -76,76 +187,26 @@ class ExcelReportGenerator:
         """
         print("Creating main metadata sheet...")
 
-        # 选择关键列
-        main_columns = [
-            'dataset_id',
-            'repository',
-            'title',
-            'hla_type',
-            'disease_type',
-            'disease_category',
-            'is_healthy',
-            'sample_type',
-            'organisms',
-            'tissues',
-            'cell_types',
-            'instruments',
-            'ptms',
-            'project_tags',
-            'keywords',
-            'publication_date',
-            'pubmed_ids',
-            'pride_url',
-            'metadata_quality',
-            'needs_manual_review',
-        ]
-
-        # 只保留存在的列
-        available_columns = [col for col in main_columns if col in df.columns]
-        main_df = df[available_columns].copy()
-
-        # 重命名列为中英文对照
-        column_names = {
-            'dataset_id': '数据集ID',
-            'repository': '数据库',
-            'title': '标题',
-            'hla_type': 'HLA类型',
-            'disease_type': '疾病类型',
-            'disease_category': '疾病类别',
-            'is_healthy': '健康对照',
-            'sample_type': '样本类型',
-            'organisms': '物种',
-            'tissues': '组织',
-            'cell_types': '细胞类型',
-            'instruments': '质谱仪器',
-            'ptms': '翻译后修饰',
-            'project_tags': '项目标签',
-            'keywords': '关键词',
-            'publication_date': '发表日期',
-            'pubmed_ids': 'PubMed ID',
-            'pride_url': 'URL',
-            'metadata_quality': '元数据质量',
-            'needs_manual_review': '需人工审核',
-        }
-
-        main_df = main_df.rename(columns=column_names)
+        # 选列+改中文表头：CoW下选取和rename都不复制底层数据
+        available_columns = [col for col in MAIN_COLUMNS if col in df.columns]
+        main_df = df[available_columns].rename(columns=COLUMN_NAMES_ZH)
 
         print(f"  ✓ Main sheet created with {len(main_df)} rows")
         return main_df
 
-    def create_disease_summary(self, df: pd.DataFrame) -> pd.DataFrame:
+    def create_disease_summary(self, df: pd.DataFrame, vc: dict) -> list:
         """创建疾病类型汇总表"""
         print("Creating disease summary sheet...")
 
         # 疾病类别统计
-        disease_category_counts = df['disease_category'].value_counts().reset_index()
+        disease_category_counts = vc['disease_category'].reset_index()
         disease_category_counts.columns = ['疾病类别', '数据集数量']
         disease_category_counts['百分比'] = (
             disease_category_counts['数据集数量'] / len(df) * 100
         ).round(2)
 
         # 具体疾病类型统计（前30个）
-        disease_type_counts = df['disease_type'].value_counts().head(30).reset_index()
+        disease_type_counts = vc['disease_type'].head(30).reset_index()
         disease_type_counts.columns = ['疾病类型', '数据集数量']
         disease_type_counts['百分比'] = (
             disease_type_counts['数据集数量'] / len(df) * 100
@@ -158,111 +219,93 @@ class ExcelReportGenerator:
             {True: '是', False: '否'}
         )
 
-        # 合并表格（添加空行分隔）
-        summary_df = pd.DataFrame()
-        summary_df = pd.concat([
-            pd.DataFrame([['疾病类别统计', '', '']]),
-            disease_category_counts,
-            pd.DataFrame([['', '', '']]),
-            pd.DataFrame([['健康对照统计', '', '']]),
-            healthy_counts,
-            pd.DataFrame([['', '', '']]),
-            pd.DataFrame([['具体疾病类型统计（前30）', '', '']]),
-            disease_type_counts,
-        ], ignore_index=True)
-
         print(f"  ✓ Disease summary created")
-        return summary_df
+        return [
+            ('疾病类别统计', disease_category_counts),
+            ('健康对照统计', healthy_counts),
+            ('具体疾病类型统计（前30）', disease_type_counts),
+        ]
 
-    def create_hla_summary(self, df: pd.DataFrame) -> pd.DataFrame:
+    def create_hla_summary(self, df: pd.DataFrame, vc: dict,
+                           mask_hla_review) -> list:
         """创建HLA分类汇总表"""
         print("Creating HLA summary sheet...")
 
         # HLA类型统计
-        hla_counts = df['hla_type'].value_counts().reset_index()
+        hla_counts = vc['hla_type'].reset_index()
         hla_counts.columns = ['HLA类型', '数据集数量']
         hla_counts['百分比'] = (
             hla_counts['数据集数量'] / len(df) * 100
         ).round(2)
 
         # 需要人工审核的HLA数据集
-        needs_review = df[df['hla_needs_review'] == True][
+        needs_review = df.loc[
+            mask_hla_review,
             ['dataset_id', 'title', 'hla_type', 'project_tags', 'keywords']
         ].copy()
         needs_review.columns = [
             '数据集ID', '标题', 'HLA类型', '项目标签', '关键词'
         ]
 
-        # 合并表格
-        summary_df = pd.concat([
-            pd.DataFrame([['HLA类型统计', '', '']]),
-            hla_counts,
-            pd.DataFrame([['', '', '']]),
-            pd.DataFrame([['需人工确认的HLA数据集', '', '', '', '']]),
-            needs_review,
-        ], ignore_index=True)
-
         print(f"  ✓ HLA summary created")
-        return summary_df
+        return [
+            ('HLA类型统计', hla_counts),
+            ('需人工确认的HLA数据集', needs_review),
+        ]
 
-    def create_sample_summary(self, df: pd.DataFrame) -> pd.DataFrame:
+    def create_sample_summary(self, df: pd.DataFrame, vc: dict) -> list:
         """创建样本类型汇总表"""
         print("Creating sample type summary sheet...")
 
         # 样本类型统计
-        sample_counts = df['sample_type'].value_counts().reset_index()
+        sample_counts = vc['sample_type'].reset_index()
         sample_counts.columns = ['样本类型', '数据集数量']
         sample_counts['百分比'] = (
             sample_counts['数据集数量'] / len(df) * 100
         ).round(2)
 
-        # 按类别分组
-        blood_samples = df[df['sample_type'].str.contains('Blood', na=False)][
+        # 按类别分组：一次extract交替正则扫描整列，
+        # 代替Blood/Tissue/Cell line三次独立的str.contains全列遍历
+        sample_cat = df['sample_type'].astype(str).str.extract(
+            r'(Blood|Tissue|Cell line)', expand=False)
+
+        blood_samples = df[(sample_cat == 'Blood').to_numpy()][
             ['dataset_id', 'sample_type', 'tissues', 'title']
         ].copy()
         blood_samples.columns = ['数据集ID', '样本类型', '组织详情', '标题']
 
-        tissue_samples = df[df['sample_type'].str.contains('Tissue', na=False)][
+        tissue_samples = df[(sample_cat == 'Tissue').to_numpy()][
             ['dataset_id', 'sample_type', 'tissues', 'title']
         ].head(50).copy()
         tissue_samples.columns = ['数据集ID', '样本类型', '组织详情', '标题']
 
-        cell_line_samples = df[df['sample_type'].str.contains('Cell line', na=False)][
+        cell_line_samples = df[(sample_cat == 'Cell line').to_numpy()][
             ['dataset_id', 'sample_type', 'cell_types', 'title']
         ].copy()
         cell_line_samples.columns = ['数据集ID', '样本类型', '细胞详情', '标题']
 
-        # 合并表格
-        summary_df = pd.concat([
-            pd.DataFrame([['样本类型统计', '', '']]),
-            sample_counts,
-            pd.DataFrame([['', '', '', '']]),
-            pd.DataFrame([['血液样本详情', '', '', '']]),
-            blood_samples,
-            pd.DataFrame([['', '', '', '']]),
-            pd.DataFrame([['细胞系样本详情', '', '', '']]),
-            cell_line_samples,
-            pd.DataFrame([['', '', '', '']]),
-            pd.DataFrame([['组织样本详情（前50）', '', '', '']]),
-            tissue_samples,
-        ], ignore_index=True)
-
         print(f"  ✓ Sample type summary created")
-        return summary_df
+        return [
+            ('样本类型统计', sample_counts),
+            ('血液样本详情', blood_samples),
+            ('细胞系样本详情', cell_line_samples),
+            ('组织样本详情（前50）', tissue_samples),
+        ]
 
-    def create_quality_report(self, df: pd.DataFrame) -> pd.DataFrame:
+    def create_quality_report(self, df: pd.DataFrame, vc: dict,
+                              mask_manual_review) -> list:
         """创建数据质量报告"""
         print("Creating quality report sheet...")
 
         # 数据质量统计
-        quality_counts = df['metadata_quality'].value_counts().reset_index()
+        quality_counts = vc['metadata_quality'].reset_index()
         quality_counts.columns = ['质量等级', '数据集数量']
         quality_counts['百分比'] = (
             quality_counts['数据集数量'] / len(df) * 100
         ).round(2)
 
         # 数据库分布
-        repo_counts = df['repository'].value_counts().reset_index()
+        repo_counts = vc['repository'].reset_index()
         repo_counts.columns = ['数据库', '数据集数量']
         repo_counts['百分比'] = (
             repo_counts['数据集数量'] / len(df) * 100
@@ -279,7 +322,8 @@ class ExcelReportGenerator:
             sdrf_counts = pd.DataFrame([['统计不可用', 0]], columns=['有SDRF文件', '数据集数量'])
 
         # 需要人工审核的数据集列表
-        manual_review = df[df['needs_manual_review'] == True][
+        manual_review = df.loc[
+            mask_manual_review,
             ['dataset_id', 'repository', 'hla_type', 'sample_type',
              'disease_type', 'metadata_quality']
         ].copy()
@@ -287,126 +331,112 @@ class ExcelReportGenerator:
             '数据集ID', '数据库', 'HLA类型', '样本类型', '疾病类型', '质量等级'
         ]
 
-        # 合并表格
-        summary_df = pd.concat([
-            pd.DataFrame([['数据质量统计', '', '']]),
-            quality_counts,
-            pd.DataFrame([['', '', '']]),
-            pd.DataFrame([['数据库分布', '', '']]),
-            repo_counts,
-            pd.DataFrame([['', '', '']]),
-            pd.DataFrame([['SDRF文件统计', '', '']]),
-            sdrf_counts,
-            pd.DataFrame([['', '', '', '', '', '']]),
-            pd.DataFrame([['需人工审核的数据集', '', '', '', '', '']]),
-            manual_review,
-        ], ignore_index=True)
-
         print(f"  ✓ Quality report created")
-        return summary_df
+        return [
+            ('数据质量统计', quality_counts),
+            ('数据库分布', repo_counts),
+            ('SDRF文件统计', sdrf_counts),
+            ('需人工审核的数据集', manual_review),
+        ]
 
-    def create_technical_summary(self, df: pd.DataFrame) -> pd.DataFrame:
+    def create_technical_summary(self, df: pd.DataFrame) -> list:
         """创建技术信息汇总表"""
         print("Creating technical summary sheet...")
 
         # 质谱仪器统计
-        instruments_data = []
-        for instruments_str in df['instruments'].dropna():
-            if instruments_str and str(instruments_str) != 'nan':
-                for instrument in str(instruments_str).split(';'):
-                    instruments_data.append(instrument.strip())
-
-        if instruments_data:
-            instrument_counts = pd.Series(instruments_data).value_counts().head(20).reset_index()
-            instrument_counts.columns = ['质谱仪器', '使用次数']
-        else:
-            instrument_counts = pd.DataFrame([['无数据', 0]], columns=['质谱仪器', '使用次数'])
+        instrument_counts = _top_counts(df['instruments'], 20, '质谱仪器', '使用次数')
 
         # PTM统计
-        ptms_data = []
-        for ptms_str in df['ptms'].dropna():
-            if ptms_str and str(ptms_str) != 'nan':
-                for ptm in str(ptms_str).split(';'):
-                    ptms_data.append(ptm.strip())
-
-        if ptms_data:
-            ptm_counts = pd.Series(ptms_data).value_counts().head(20).reset_index()
-            ptm_counts.columns = ['翻译后修饰类型', '出现次数']
-        else:
-            ptm_counts = pd.DataFrame([['无数据', 0]], columns=['翻译后修饰类型', '出现次数'])
+        ptm_counts = _top_counts(df['ptms'], 20, '翻译后修饰类型', '出现次数')
 
         # 物种统计
-        organisms_data = []
-        for org_str in df['organisms'].dropna():
-            if org_str and str(org_str) != 'nan':
-                for org in str(org_str).split(';'):
-                    organisms_data.append(org.strip())
-
-        if organisms_data:
-            organism_counts = pd.Series(organisms_data).value_counts().head(15).reset_index()
-            organism_counts.columns = ['物种', '数据集数量']
-        else:
-            organism_counts = pd.DataFrame([['无数据', 0]], columns=['物种', '数据集数量'])
-
-        # 合并表格
-        summary_df = pd.concat([
-            pd.DataFrame([['质谱仪器统计（前20）', '']]),
-            instrument_counts,
-            pd.DataFrame([['', '']]),
-            pd.DataFrame([['翻译后修饰统计（前20）', '']]),
-            ptm_counts,
-            pd.DataFrame([['', '']]),
-            pd.DataFrame([['物种分布（前15）', '']]),
-            organism_counts,
-        ], ignore_index=True)
+        organism_counts = _top_counts(df['organisms'], 15, '物种', '数据集数量')
 
         print(f"  ✓ Technical summary created")
-        return summary_df
-
-    def format_excel(self, writer):
-        """格式化Excel文件（如果openpyxl可用）"""
-        if not OPENPYXL_AVAILABLE:
-            return
-
-        print("\nApplying Excel formatting...")
-
-        workbook = writer.book
-
-        # 定义样式
-        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True, size=11)
-        section_fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-        section_font = Font(bold=True, size=12)
-
-        # 格式化每个工作表
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-
-            # 设置标题行样式
-            for cell in sheet[1]:
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-
-            # 自动调整列宽
-            for column in sheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-
-                for cell in column:
-                    try:
-                        if cell.value:
-                            max_length = max(max_length, len(str(cell.value)))
-                    except:
-                        pass
-
-                adjusted_width = min(max_length + 2, 60)
-                sheet.column_dimensions[column_letter].width = adjusted_width
+        return [
+            ('质谱仪器统计（前20）', instrument_counts),
+            ('翻译后修饰统计（前20）', ptm_counts),
+            ('物种分布（前15）', organism_counts),
+        ]
 
-            # 冻结首行
-            sheet.freeze_panes = sheet['A2']
+    def _write_sheet(self, wb, sheet_name: str, df: pd.DataFrame, header: bool):
+        """流式写入单个工作表
 
-        print("  ✓ Excel formatting applied")
+        write_only模式下不能事后回读改样式，所以首行样式、
+        冻结窗格和列宽都在写入时一并设定
+        """
+        ws = wb.create_sheet(sheet_name)
+        ws.freeze_panes = 'A2'
+
+        # NaN转None：openpyxl不接受float('nan')单元格
+        empty = df.isna() | df.eq('')
+        df = df.astype(object).where(~empty, None)
+
+        # 列宽向量化计算：一次map(len)代替逐单元格的Python len()扫描
+        # （与原逻辑一致：min(最大内容宽+2, 60)，空单元格不计入）
+        col_max = df.where(~empty, '').astype(str).map(len).max().fillna(0)
+        if header:
+            col_max = col_max.combine(
+                pd.Series({c: len(str(c)) for c in df.columns}), max)
+        for i, width in enumerate((col_max + 2).clip(upper=60), 1):
+            ws.column_dimensions[get_column_letter(i)].width = width
+
+        # 首行带表头样式：有表头时是列名行，无表头时是首个小节标题行
+        rows = df.itertuples(index=False, name=None)
+        first_row = tuple(df.columns) if header else next(rows, None)
+        if first_row is not None:
+            styled = []
+            for value in first_row:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = 'hdr'
+                styled.append(cell)
+            ws.append(styled)
+
+        for row in rows:
+            ws.append(row)
+
+    def _write_block_sheet(self, wb, sheet_name: str, blocks: list):
+        """按块流式写入汇总表
+
+        每块为 小节标题行 + 列名行 + 数据行，块间空行分隔；
+        各块保留原生dtype直接append，不再经过pd.concat的
+        列错位对齐和object升格拷贝
+        """
+        ws = wb.create_sheet(sheet_name)
+        ws.freeze_panes = 'A2'
+
+        # 列宽取所有块（标题/列名/数据）的并集最大值
+        col_max = []
+
+        def fold(lengths):
+            for i, length in enumerate(lengths):
+                if i < len(col_max):
+                    col_max[i] = max(col_max[i], length)
+                else:
+                    col_max.append(length)
+
+        prepared = []
+        for title, bdf in blocks:
+            empty = bdf.isna() | bdf.eq('')
+            bdf = bdf.astype(object).where(~empty, None)
+            fold([len(str(title))])
+            fold([len(str(c)) for c in bdf.columns])
+            fold(int(n) for n in
+                 bdf.where(~empty, '').astype(str).map(len).max().fillna(0))
+            prepared.append((title, bdf))
+
+        for i, width in enumerate(col_max, 1):
+            ws.column_dimensions[get_column_letter(i)].width = min(width + 2, 60)
+
+        for block_i, (title, bdf) in enumerate(prepared):
+            if block_i:
+                ws.append([])
+            title_cell = WriteOnlyCell(ws, value=title)
+            title_cell.style = 'hdr'
+            ws.append([title_cell])
+            ws.append(list(bdf.columns))
+            for row in bdf.itertuples(index=False, name=None):
+                ws.append(row)
 
     def generate_report(self):
         """生成完整的Excel报告"""
@@ -417,34 +447,47 @@ class ExcelReportGenerator:
         # 加载数据
         df = self.load_data()
 
-        # 创建Excel writer
-        with pd.ExcelWriter(self.output_file, engine='openpyxl') as writer:
-            # Sheet 1: 主元数据表
-            main_df = self.create_main_sheet(df)
-            main_df.to_excel(writer, sheet_name='主元数据表', index=False)
-
-            # Sheet 2: 疾病类型汇总
-            disease_df = self.create_disease_summary(df)
-            disease_df.to_excel(writer, sheet_name='疾病类型汇总', index=False, header=False)
+        # 每个统计列只value_counts一次，各汇总表与验证报告共用
+        vc = {col: df[col].value_counts() for col in _COUNTED_COLUMNS}
 
-            # Sheet 3: HLA分类汇总
-            hla_df = self.create_hla_summary(df)
-            hla_df.to_excel(writer, sheet_name='HLA分类汇总', index=False, header=False)
+        # 人工审核布尔掩码只构造一次：布尔列本身即掩码，
+        # 不再在每个汇总方法里重做== True的逐元素比较
+        mask_manual = df['needs_manual_review'].fillna(False).astype(bool).to_numpy()
+        mask_hla = df['hla_needs_review'].fillna(False).astype(bool).to_numpy()
 
-            # Sheet 4: 样本类型汇总
-            sample_df = self.create_sample_summary(df)
-            sample_df.to_excel(writer, sheet_name='样本类型汇总', index=False, header=False)
+        main_df = self.create_main_sheet(df)
 
-            # Sheet 5: 技术信息汇总
-            tech_df = self.create_technical_summary(df)
-            tech_df.to_excel(writer, sheet_name='技术信息汇总', index=False, header=False)
-
-            # Sheet 6: 数据质量报告
-            quality_df = self.create_quality_report(df)
-            quality_df.to_excel(writer, sheet_name='数据质量报告', index=False, header=False)
+        # (工作表名, 小节块列表)
+        block_sheets = [
+            ('疾病类型汇总', self.create_disease_summary(df, vc)),
+            ('HLA分类汇总', self.create_hla_summary(df, vc, mask_hla)),
+            ('样本类型汇总', self.create_sample_summary(df, vc)),
+            ('技术信息汇总', self.create_technical_summary(df)),
+            ('数据质量报告', self.create_quality_report(df, vc, mask_manual)),
+        ]
 
-            # 应用格式
-            self.format_excel(writer)
+        if OPENPYXL_AVAILABLE:
+            # write_only工作簿：单元格直接流式写入XML，
+            # 不在内存中构建整个工作簿的单元格对象图
+            wb = Workbook(write_only=True)
+            wb.add_named_style(_HEADER_STYLE)
+            self._write_sheet(wb, '主元数据表', main_df, header=True)
+            for sheet_name, blocks in block_sheets:
+                self._write_block_sheet(wb, sheet_name, blocks)
+            wb.save(self.output_file)
+            print("\n  ✓ Excel formatting applied")
+        else:
+            with pd.ExcelWriter(self.output_file) as writer:
+                main_df.to_excel(writer, sheet_name='主元数据表', index=False)
+                for sheet_name, blocks in block_sheets:
+                    startrow = 0
+                    for title, bdf in blocks:
+                        pd.DataFrame([[title]]).to_excel(
+                            writer, sheet_name=sheet_name, index=False,
+                            header=False, startrow=startrow)
+                        bdf.to_excel(writer, sheet_name=sheet_name,
+                                     index=False, startrow=startrow + 1)
+                        startrow += len(bdf) + 3
 
         print("\n" + "="*60)
         print("Report Generation Summary")
@@ -457,52 +500,44 @@ class ExcelReportGenerator:
         print("\n")
 
         # 生成质量报告文本文件
-        self.generate_validation_report(df)
+        self.generate_validation_report(df, vc, mask_manual)
 
-    def generate_validation_report(self, df: pd.DataFrame):
-        """生成验证报告文本文件"""
+    def generate_validation_report(self, df: pd.DataFrame, vc: dict,
+                                   mask_manual_review):
+        """生成验证报告文本文件（在内存中拼好后一次性写入）"""
         report_file = DATA_VALIDATION_DIR / "quality_report.txt"
 
+        parts = [
+            "="*60 + "\n",
+            "HLA元数据收集质量报告\n",
+            f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+            "="*60 + "\n\n",
+
+            f"总数据集数量: {len(df)}\n\n",
+        ]
+
+        for title, counts in (
+                ("数据库分布", vc['repository']),
+                ("HLA类型分布", vc['hla_type']),
+                ("样本类型分布", vc['sample_type'].head(10)),
+                ("疾病类别分布", vc['disease_category']),
+                ("数据质量分布", vc['metadata_quality'])):
+            parts.append(f"{title}:\n")
+            parts.extend(f"  {k}: {v}\n" for k, v in counts.items())
+            parts.append("\n")
+
+        review_count = int(mask_manual_review.sum())
+        parts.append(f"需要人工审核的数据集: {review_count}\n")
+
+        if review_count > 0:
+            # 向量化字符串拼接代替iterrows逐行取值
+            review = df.loc[mask_manual_review, ['dataset_id', 'hla_type']]
+            parts.append("\n需人工审核的数据集列表:\n")
+            parts.extend(('  - ' + review['dataset_id'].astype(str)
+                          + ': ' + review['hla_type'].astype(str) + '\n').tolist())
+
         with open(report_file, 'w', encoding='utf-8') as f:
-            f.write("="*60 + "\n")
-            f.write("HLA元数据收集质量报告\n")
-            f.write(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write("="*60 + "\n\n")
-
-            f.write(f"总数据集数量: {len(df)}\n\n")
-
-            f.write("数据库分布:\n")
-            for repo, count in df['repository'].value_counts().items():
-                f.write(f"  {repo}: {count}\n")
-            f.write("\n")
-
-            f.write("HLA类型分布:\n")
-            for hla_type, count in df['hla_type'].value_counts().items():
-                f.write(f"  {hla_type}: {count}\n")
-            f.write("\n")
-
-            f.write("样本类型分布:\n")
-            for sample_type, count in df['sample_type'].value_counts().head(10).items():
-                f.write(f"  {sample_type}: {count}\n")
-            f.write("\n")
-
-            f.write("疾病类别分布:\n")
-            for disease_cat, count in df['disease_category'].value_counts().items():
-                f.write(f"  {disease_cat}: {count}\n")
-            f.write("\n")
-
-            f.write("数据质量分布:\n")
-            for quality, count in df['metadata_quality'].value_counts().items():
-                f.write(f"  {quality}: {count}\n")
-            f.write("\n")
-
-            review_count = df['needs_manual_review'].sum()
-            f.write(f"需要人工审核的数据集: {review_count}\n")
-
-            if review_count > 0:
-                f.write("\n需人工审核的数据集列表:\n")
-                for idx, row in df[df['needs_manual_review'] == True].iterrows():
-                    f.write(f"  - {row['dataset_id']}: {row['hla_type']}\n")
+            f.write(''.join(parts))
 
         print(f"✓ Validation report saved to: {report_file}")
 